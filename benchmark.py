@@ -0,0 +1,127 @@
+"""
+Micro-benchmark of the core value types used in the hot loop: ID allocation, Pose/Box attribute access
+and Translation.relative_to_pose, each compared to the previous implementation.
+"""
+import math
+import sys
+import threading
+import timeit
+
+from vision_processing.utils import Box, Pose, Translation, _Counter
+
+
+class _IntCounter:
+    # Previous counter, a plain int incremented in Python
+    def __init__(self, start=0):
+        self._val = start - 1
+
+    def next(self):
+        self._val += 1
+        return self._val
+
+
+class _DictPose:
+    # Previous dict-backed Pose
+    def __init__(self, translation: Translation, rot: float) -> None:
+        self.translation = translation
+        self.rot = rot
+
+    @property
+    def x(self) -> float:
+        return self.translation.x
+
+    @property
+    def y(self) -> float:
+        return self.translation.y
+
+
+class _DictBox:
+    # Previous dict-backed Box
+    def __init__(self, lower_limit: Translation, upper_limit: Translation):
+        self.lower_limit = lower_limit
+        self.upper_limit = upper_limit
+        self.center = (self.lower_limit + self.upper_limit) / 2
+        self.radius = abs(self.lower_limit - self.center)
+
+
+def _polar_relative_to_pose(translation: Translation, pose) -> Translation:
+    # Previous Translation.relative_to_pose, recomputing the trig of the pose every call
+    # (with math.hypot standing in for the slower scipy euclidean distance it used)
+    polar_coordinates = (
+        math.hypot(translation.x, translation.y),
+        math.atan2(translation.y, translation.x) + pose.rot,
+    )
+    x = math.cos(polar_coordinates[1]) * polar_coordinates[0] + pose.x
+    y = math.sin(polar_coordinates[1]) * polar_coordinates[0] + pose.y
+    return Translation(x, y)
+
+
+def _size_of(obj) -> int:
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def _duplicate_ids(counter, threads: int = 4, per_thread: int = 200000) -> int:
+    ids = []
+
+    def allocate():
+        ids.extend([counter.next() for _ in range(per_thread)])
+
+    workers = [threading.Thread(target=allocate) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(ids) - len(set(ids))
+
+
+def _report(name: str, old: float, new: float, number: int):
+    print(
+        f"{name:<32} old {old / number * 1e9:8.1f} ns   new {new / number * 1e9:8.1f} ns   "
+        f"speedup {old / new:5.2f}x"
+    )
+
+
+def main(number: int = 1000000):
+    old_counter, new_counter = _IntCounter(), _Counter()
+    _report(
+        "ID allocation",
+        timeit.timeit(old_counter.next, number=number),
+        timeit.timeit(new_counter.next, number=number),
+        number,
+    )
+    print(f"{'Duplicate IDs across threads':<32} old {_duplicate_ids(_IntCounter()):8d}      "
+          f"new {_duplicate_ids(_Counter()):8d}")
+
+    translation = Translation(1.5, -0.5)
+    old_pose, new_pose = _DictPose(translation, 0.3), Pose(translation, 0.3)
+    _report(
+        "Pose attribute access",
+        timeit.timeit(lambda: (old_pose.translation, old_pose.rot), number=number),
+        timeit.timeit(lambda: (new_pose.translation, new_pose.rot), number=number),
+        number,
+    )
+    _report(
+        "Translation.relative_to_pose",
+        timeit.timeit(lambda: _polar_relative_to_pose(translation, old_pose), number=number),
+        timeit.timeit(lambda: translation.relative_to_pose(new_pose), number=number),
+        number,
+    )
+
+    lower, upper = Translation(0, 0), Translation(1, 1)
+    old_box, new_box = _DictBox(lower, upper), Box(lower, upper)
+    _report(
+        "Box attribute access",
+        timeit.timeit(lambda: (old_box.center, old_box.radius), number=number),
+        timeit.timeit(lambda: (new_box.center, new_box.radius), number=number),
+        number,
+    )
+
+    print(f"{'Pose size':<32} old {_size_of(old_pose):8d} B    new {_size_of(new_pose):8d} B")
+    print(f"{'Box size':<32} old {_size_of(old_box):8d} B    new {_size_of(new_box):8d} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,13 @@
+import signal
+import sys
+
+import vision_processing
 from run import PipelineRunner
 
-pipeline = PipelineRunner()
+# Stopping the service raises SystemExit, so run() still writes an unfinished profiling window
+signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+if len(sys.argv) > 1:
+    pipeline = PipelineRunner.from_config(vision_processing.PipelineConfig.load(sys.argv[1]))
+else:
+    pipeline = PipelineRunner()
 pipeline.run()
@@ -1,3 +1,5 @@
+import signal
+import sys
 import time
 from operator import attrgetter
 
@@ -10,10 +12,37 @@ class PipelineRunner:
     def __init__(
             self,
             communications: vision_processing.NetworkCommunication = vision_processing.NetworkCommunication(),
-            cameras: List[vision_processing.Camera] = None
+            cameras: List[vision_processing.Camera] = None,
+            detection_cache: vision_processing.DetectionCache = None,
+            supervise_cameras: bool = True,
+            object_detection: vision_processing.DynamicObjectProcessing = None,
+            field_grid: vision_processing.FieldGrid = None,
+            latency_compensation: vision_processing.LatencyCompensation = None,
+            world_state: vision_processing.WorldState = None,
+            stages: List[str] = vision_processing.PipelineConfig.stages,
+            cycle_rate: float = 0,
+            name: str = "default",
+            profiler: vision_processing.PipelineProfiler = None,
+            profile: bool = False,
+            detector_hang_timeout: float = 2.0
     ):
         self.communications = communications
-        self.object_detection = vision_processing.DynamicObjectProcessing()
+        self.detection_cache = detection_cache
+        self.stages = set(stages)
+        self.cycle_rate = cycle_rate
+        self.name = name
+        # Profiling runs while profile is set or while it is switched on through NetworkTables
+        self.profiler = profiler or vision_processing.PipelineProfiler()
+        self.profile = profile
+
+        self.object_detection = object_detection
+        if self.object_detection is None and "object_detection" in self.stages:
+            self.object_detection = vision_processing.DynamicObjectProcessing(cache=detection_cache)
+        self.field_grid = field_grid or vision_processing.FieldGrid.from_game_field()
+        if "field_filter" in self.stages:
+            self.field_grid.check_contains(vision_processing.GameField.reference_points.values())
+        self.latency_compensation = latency_compensation or vision_processing.LatencyCompensation()
+        self.world_state = world_state or vision_processing.WorldState()
 
         if cameras is None:
             self.cameras = [
@@ -23,31 +52,284 @@ class PipelineRunner:
         else:
             self.cameras = cameras
 
+        # Live cameras are captured in the background, so a hung camera cannot stall the cycle
+        self.camera_supervisors = []
+        if supervise_cameras:
+            self.camera_supervisors = [vision_processing.CameraSupervisor(camera) for camera in self.cameras]
+            self.camera_health = [supervisor.health for supervisor in self.camera_supervisors]
+        else:
+            self.camera_health = [
+                vision_processing.ComponentHealth(f"Camera {camera.port_id}") for camera in self.cameras
+            ]
+        self.object_detection_health = vision_processing.ComponentHealth("Object Detection")
+        # Inference runs on a worker thread, so a hung interpreter is abandoned and reloaded instead of stalling
+        self.object_detection_worker = vision_processing.DetectorWorker("Object Detection", detector_hang_timeout)
+        self.apriltag_health = vision_processing.ComponentHealth("AprilTag Detection")
+
+    @classmethod
+    def from_config(
+            cls,
+            config: vision_processing.PipelineConfig,
+            communications: vision_processing.NetworkCommunication = None
+    ) -> "PipelineRunner":
+        """Builds the pipeline described by a config, see PipelineConfig for its layout"""
+        detection_cache = None
+        if config["detection_cache"] is not None:
+            detection_cache = vision_processing.DetectionCache(config["detection_cache"])
+
+        cameras = None
+        if config["cameras"]:
+            cameras = [
+                vision_processing.Camera(
+                    tuple(camera["translational_offset"]),
+                    tuple(camera["rotational_offset"]),
+                    camera["focal_length"],
+                    camera["port"],
+                    calibration=(
+                        vision_processing.CameraCalibration.from_file(camera["calibration"])
+                        if camera["calibration"] is not None else None
+                    ),
+                    undistort_frames=camera["undistort_frames"],
+                    capture_settings=vision_processing.CaptureSettings(**camera["capture"]),
+                )
+                for camera in config["cameras"]
+            ]
+
+        object_detection = None
+        if "object_detection" in config["stages"]:
+            settings = config["object_detection"]
+            object_detection = vision_processing.DynamicObjectProcessing(
+                model_path=settings["model"],
+                edgetpu_model_path=settings["edgetpu_model"],
+                labels_path=settings["labels"],
+                score_threshold=settings["score_threshold"],
+                swap_rb=settings["swap_rb"],
+                input_mean=settings["input_mean"],
+                input_std=settings["input_std"],
+                letterbox=settings["letterbox"],
+                cache=detection_cache,
+                tiled=settings["tiled"],
+                far_field_distance=settings["far_field_distance"],
+                tile_overlap=settings["tile_overlap"],
+                nms_iou_threshold=settings["nms_iou_threshold"],
+                use_opencl=settings["use_opencl"],
+            )
+
+        vision_processing.ReferencePoint.configure(**config["apriltags"])
+        profiling = dict(config["profiling"])
+        profile = profiling.pop("enabled")
+
+        return cls(
+            communications=communications or vision_processing.NetworkCommunication(),
+            cameras=cameras,
+            detection_cache=detection_cache,
+            supervise_cameras=config["supervise_cameras"],
+            object_detection=object_detection,
+            field_grid=vision_processing.FieldGrid.from_game_field(**config["field_filter"]),
+            latency_compensation=vision_processing.LatencyCompensation(**config["latency_compensation"]),
+            world_state=vision_processing.WorldState(**config["world_state"]),
+            stages=config["stages"],
+            cycle_rate=config["cycle_rate"],
+            name=config["name"],
+            profiler=vision_processing.PipelineProfiler(**profiling),
+            profile=profile,
+        )
+
+    def _run_detector(
+            self,
+            health: vision_processing.ComponentHealth,
+            detect,
+            camera,
+            reload=None,
+            worker: vision_processing.DetectorWorker = None
+    ) -> list:
+        """
+        Runs a detector over a camera, recording its health. Dead detectors are skipped between retries,
+        and reloaded before they are retried. Camera failures are raised to be recorded against the camera.
+        With a worker, calls which hang are abandoned and the detector is reloaded before it is used again.
+        """
+        if not health.should_attempt():
+            return []
+
+        def call(function, *args):
+            return function(*args) if worker is None else worker.run(function, *args)
+
+        start = time.time()
+        try:
+            # The abandoned call may still be using the hung detector, so it is replaced right away
+            hung = isinstance(health.last_error, vision_processing.DetectorHungError)
+            if reload is not None and (health.state == health.DEAD or hung):
+                call(reload)
+            results = call(detect, camera)
+        except vision_processing.FrameUnavailableError:
+            raise
+        except Exception as error:
+            health.record_failure(error)
+            return []
+        health.record_success(time.time() - start)
+        return results
+
+    def _process_camera(self, camera: vision_processing.Camera, camera_health: vision_processing.ComponentHealth):
+        """Returns the camera's objects and reference points, and its frame's capture time if a frame was read"""
+        dynamic_objects, reference_points = [], []
+        if not camera_health.should_attempt():
+            return dynamic_objects, reference_points, None
+
+        try:
+            if "object_detection" in self.stages:
+                dynamic_objects = self._run_detector(
+                    self.object_detection_health,
+                    self.object_detection.get_dynamic_objects,
+                    camera,
+                    reload=self.object_detection.load_interpreter,
+                    worker=self.object_detection_worker,
+                )
+            if "apriltags" in self.stages:
+                reference_points = self._run_detector(
+                    self.apriltag_health,
+                    lambda cam: vision_processing.ReferencePoint.from_apriltags(cam, self.detection_cache),
+                    camera,
+                )
+        except vision_processing.FrameUnavailableError as error:
+            camera_health.record_failure(error)
+            return dynamic_objects, reference_points, None
+
+        camera_health.record_success()
+        if "object_detection" not in self.stages and "apriltags" not in self.stages:
+            return dynamic_objects, reference_points, None
+        return dynamic_objects, reference_points, camera.get_frame_time()
+
+    def publish_world_delta(self, capture_time: float = None):
+        """Publishes the world state's changes, predicted forward from capture_time unless it is None"""
+        delta = self.world_state.delta()
+        objects = list(delta.objects.values())
+        snapshot = None if delta.snapshot is None else list(delta.snapshot.values())
+        if capture_time is not None:
+            # The robot pose is predicted from when it was measured, which can be an earlier cycle
+            pose, pose_time = self.world_state.robot_pose, self.world_state.pose_time
+            target_time = self.latency_compensation.target_time(capture_time)
+            objects = self.latency_compensation.predict_objects(objects, pose, pose_time, target_time)
+            if snapshot is not None:
+                snapshot = self.latency_compensation.predict_objects(snapshot, pose, pose_time, target_time)
+        self.communications.send_world_delta(
+            delta.version, delta.previous_version, delta.added, delta.updated, delta.removed, objects, snapshot
+        )
+
+    def profile_tags(self) -> dict:
+        """Describes the pipeline and its cameras, written next to every profile"""
+        tags = {
+            "name": self.name,
+            "stages": sorted(self.stages),
+            "cameras": [
+                {
+                    "port": camera.port_id,
+                    "frame_size": camera.frame_size,
+                    "capture": {
+                        field: getattr(camera.capture_settings, field, None)
+                        for field in vision_processing.CaptureSettings._fields
+                    },
+                    "undistort_frames": camera.undistort_frames,
+                    "supervised": camera.frame_source is not None,
+                }
+                for camera in self.cameras
+            ],
+        }
+        if self.object_detection is not None:
+            # Read loosely, so stand-in detectors can be profiled too
+            tags["object_detection"] = {
+                attribute: getattr(self.object_detection, attribute, None)
+                for attribute in ("model_path", "hardware_type", "letterbox", "tiled", "use_opencl")
+            }
+        return tags
+
     def run(self, num_of_cycles: int = -1):
         cycle_count = 0
-        while cycle_count != num_of_cycles:
-            cycle_count += 1
+        try:
+            while cycle_count != num_of_cycles:
+                cycle_count += 1
+                if not self.profiler.active and (self.profile or self.communications.profiling_requested()):
+                    self.profiler.start(cycle_count, self.profile_tags())
+
+                dynamic_objects = []
+                reference_points = []
+                frame_times = []
+                timestamp = time.time()
+
+                # Processing frames, skipping cameras which stopped delivering them
+                for camera, camera_health in zip(self.cameras, self.camera_health):
+                    camera_objects, camera_reference_points, frame_time = self._process_camera(camera, camera_health)
+                    dynamic_objects.extend(camera_objects)
+                    reference_points.extend(camera_reference_points)
+                    if frame_time is not None:
+                        frame_times.append(frame_time)
+                # Latency is measured from the oldest frame used, including the time it waited before the cycle
+                capture_time = min(frame_times, default=timestamp)
+
+                # Rejecting poses outside the field or inside dead zones
+                if "field_filter" in self.stages:
+                    reference_points = [
+                        point for point in reference_points
+                        if self.field_grid.is_pose_reachable(point.robot_pose.translation)
+                    ]
+
+                robot_pose, pose_time = None, capture_time
+                if reference_points:
+                    best_reference_point = max(reference_points, key=attrgetter("decision_margin"))
+                    robot_pose, pose_time = best_reference_point.robot_pose, best_reference_point.timestamp
+                    self.latency_compensation.update_pose(robot_pose, pose_time)
+                    self.world_state.update_pose(robot_pose, pose_time)
+
+                # Objects are placed with the last known pose when no AprilTag is visible this cycle
+                for dynamic_object in dynamic_objects:
+                    dynamic_object.add_absolute_coordinates(self.world_state.robot_pose)
+                if self.world_state.has_pose and "field_filter" in self.stages:
+                    dynamic_objects = self.field_grid.filter_objects(dynamic_objects)
+
+                # Predicting outputs forward to when the roboRIO will use them
+                compensate = "latency_compensation" in self.stages
+                self.latency_compensation.record_latency(capture_time, time.time())
+                if robot_pose is not None:
+                    try:
+                        self.communications.send_pose(
+                            self.latency_compensation.predict_pose(robot_pose, pose_time) if compensate else robot_pose
+                        )
+                    except Exception as error:
+                        print(f"Failed to send pose: {error!r}")
 
-            dynamic_objects = []
-            reference_points = []
-            timestamp = time.time()
+                if "world_state" in self.stages:
+                    # Without a pose the objects' absolute coordinates are relative to the robot, not the field
+                    if self.world_state.has_pose:
+                        self.world_state.merge(dynamic_objects, capture_time)
+                        self.publish_world_delta(capture_time if compensate else None)
+                else:
+                    if compensate:
+                        dynamic_objects = self.latency_compensation.predict_objects(
+                            dynamic_objects, robot_pose, pose_time, self.latency_compensation.target_time(capture_time)
+                        )
+                    self.communications.send_objects(dynamic_objects)
 
-            # Processing frames
-            for camera in self.cameras:
-                dynamic_objects.extend(self.object_detection.get_dynamic_objects(camera))
-                reference_points.extend(vision_processing.ReferencePoint.from_apriltags(camera))
+                health = self.camera_health + [self.object_detection_health, self.apriltag_health]
+                self.communications.send_health(
+                    [component.name for component in health], [component.state for component in health]
+                )
 
-            if reference_points:
-                try:
-                    self.communications.send_pose(max(reference_points, key=attrgetter("decision_margin")).robot_pose)
-                except:
-                    print("AprilTag not detected.")
+                # Printing FPS
+                fps = 1 / ((time.time() - timestamp) or 1e-9)  # prevent divide-by-zero
+                print(f"Cycle {cycle_count} ({self.name}) was successful.\nFPS: {round(fps, 3)}")
+                self.profiler.record_cycle(cycle_count)
 
-            self.communications.send_objects(dynamic_objects)
+                if self.cycle_rate:
+                    time.sleep(max(0.0, timestamp + 1 / self.cycle_rate - time.time()))
+        finally:
+            # A window cut short by the end of the run, Ctrl-C or an error is still written
+            if self.profiler.active:
+                self.profiler.stop(cycle_count)
 
-            # Printing FPS
-            fps = 1 / ((time.time() - timestamp) or 1e-9)  # prevent divide-by-zero
-            print(f"Cycle {cycle_count} was successful.\nFPS: {round(fps, 3)}")
 
 if __name__ == "__main__":
-    PipelineRunner().run()
+    # Stopping the service raises SystemExit, so run() still writes an unfinished profiling window
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if len(sys.argv) > 1:
+        PipelineRunner.from_config(vision_processing.PipelineConfig.load(sys.argv[1])).run()
+    else:
+        PipelineRunner().run()
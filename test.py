@@ -5,6 +5,8 @@ from run import PipelineRunner
 
 pipeline = PipelineRunner(
     communications=testing.TestNetworkCommunication(),
-    cameras=[vision_processing.Camera.from_list(vision_processing.GameField.test_camera)]
+    cameras=[vision_processing.Camera.from_list(vision_processing.GameField.test_camera)],
+    detection_cache=vision_processing.DetectionCache("testing/testing_resources/detection_cache"),
+    supervise_cameras=False
 )
 pipeline.run()
@@ -1 +1,2 @@
 from .test_network_communinications import *
+from .test_cameras import *
@@ -0,0 +1,80 @@
+import time
+
+import cv2
+import numpy as np
+
+from vision_processing import Camera, GameField
+
+
+class FakeCapture:
+    def __init__(
+        self,
+        frame_size=(640, 480),
+        fail_after: int = None,
+        hang_after: int = None,
+        hang_time: float = 5,
+        unplugged: bool = False,
+    ):
+        """
+        Stand-in for cv2.VideoCapture delivering blank frames, which starts failing or hanging after a number of reads
+        :param fail_after: number of good reads before every read fails
+        :param hang_after: number of good reads before every read blocks for hang_time seconds
+        :param unplugged: behave like a missing device, which reports no frame size and fails every read
+        """
+        self.frame = np.zeros((frame_size[1], frame_size[0], 3), dtype=np.uint8)
+        self.unplugged = unplugged
+        if unplugged:
+            fail_after = 0
+        self.fail_after = fail_after
+        self.hang_after = hang_after
+        self.hang_time = hang_time
+        self.reads = 0
+
+    def read(self, image=None):
+        self.reads += 1
+        if self.hang_after is not None and self.reads > self.hang_after:
+            time.sleep(self.hang_time)
+        if self.fail_after is not None and self.reads > self.fail_after:
+            return False, None
+        if image is not None and image.shape == self.frame.shape:
+            image[...] = self.frame
+            return True, image
+        return True, self.frame.copy()
+
+    def get(self, prop):
+        if self.unplugged:
+            return 0
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frame.shape[1]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frame.shape[0]
+        return 0
+
+    def release(self):
+        pass
+
+
+class FakeCaptureSettings:
+    # Duck-typed CaptureSettings which opens a FakeCapture, and opens a working one when reopened
+    width = None
+    height = None
+
+    def __init__(self, capture: FakeCapture, reopened_capture: FakeCapture = None):
+        self.captures = [capture, reopened_capture or FakeCapture((capture.frame.shape[1], capture.frame.shape[0]))]
+
+    def open(self, port_id):
+        if len(self.captures) > 1:
+            return self.captures.pop(0)
+        return self.captures[0]
+
+
+class FailingCamera(Camera):
+    def __init__(self, name: str, capture: FakeCapture, reopened_capture: FakeCapture = None):
+        """Camera with the test camera's placement, reading from scripted fake captures"""
+        super().__init__(
+            GameField.test_camera[0],
+            GameField.test_camera[1],
+            GameField.test_camera[2],
+            name,
+            capture_settings=FakeCaptureSettings(capture, reopened_capture),
+        )
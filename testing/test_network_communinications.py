@@ -12,6 +12,24 @@ class TestNetworkCommunication(NetworkCommunication):
         print(f"xPos: {[obj.absolute_coordinates[0] for obj in objs]}")
         print(f"yPos: {[obj.absolute_coordinates[1] for obj in objs]}")
 
+    def send_world_delta(self, version: int, previous_version: int, added: List[int], updated: List[int],
+                         removed: List[int], objs: List[DynamicObject], snapshot: List[DynamicObject] = None):
+        if snapshot is not None:
+            print(f"\nWorld Snapshot {version}: {[obj.id for obj in snapshot]}")
+        if not (added or updated or removed):
+            return
+        print(f"\nWorld Version {version} (from {previous_version})")
+        print(f"Added: {added}")
+        print(f"Updated: {updated}")
+        print(f"Removed: {removed}")
+        print(f"xPos: {[obj.absolute_coordinates[0] for obj in objs]}")
+        print(f"yPos: {[obj.absolute_coordinates[1] for obj in objs]}")
+
+    def send_health(self, names: List[str], states: List[str]):
+        unhealthy = [f"{name}: {state}" for name, state in zip(names, states) if state != "ok"]
+        if unhealthy:
+            print(f"\nHealth: {unhealthy}")
+
     def send_pose(self, pose: Pose):
         print("\nRobot Position")
         print(f"xPos: {pose.x}")
@@ -0,0 +1,142 @@
+import collections
+import time
+
+from run import PipelineRunner
+from vision_processing import Camera
+from testing.test_cameras import FailingCamera, FakeCapture
+from testing.test_network_communinications import TestNetworkCommunication
+
+
+class FrameCountingDetection:
+    # Stand-in for DynamicObjectProcessing which only reads a frame and counts it per camera
+    def __init__(self):
+        self.frames = collections.Counter()
+
+    def get_dynamic_objects(self, cam):
+        cam.get_frame()
+        self.frames[cam.port_id] += 1
+        return []
+
+    def load_interpreter(self):
+        pass
+
+
+def test_good_camera_keeps_running_while_bad_cameras_degrade_and_reopen():
+    good = FailingCamera("good", FakeCapture())
+    failing = FailingCamera("failing", FakeCapture(fail_after=3))
+    hanging = FailingCamera("hanging", FakeCapture(hang_after=3, hang_time=5))
+    failing_capture, hanging_capture = failing.input_feed, hanging.input_feed
+
+    detection = FrameCountingDetection()
+    runner = PipelineRunner(
+        communications=TestNetworkCommunication(),
+        cameras=[good, failing, hanging],
+        object_detection=detection,
+        stages=["object_detection"],
+        cycle_rate=20,
+    )
+
+    states = collections.defaultdict(list)
+    cycles = 0
+    start = time.time()
+    try:
+        while time.time() - start < 6:
+            runner.run(1)
+            cycles += 1
+            for health in runner.camera_health:
+                states[health.name].append(health.state)
+    finally:
+        for supervisor in runner.camera_supervisors:
+            supervisor.stop()
+
+    # The good camera delivered a frame every cycle, it was never held up by the others
+    assert detection.frames["good"] == cycles
+    assert set(states["Camera good"]) == {"ok"}
+
+    for name in ("Camera failing", "Camera hanging"):
+        history = states[name]
+        assert "degraded" in history and "dead" in history, history
+        assert history.index("degraded") < history.index("dead"), history
+        # Reopened cameras deliver frames again
+        assert history[-1] == "ok", history
+
+    assert failing.input_feed is not failing_capture
+    assert hanging.input_feed is not hanging_capture
+
+
+def test_camera_unplugged_at_startup_is_opened_later():
+    good = FailingCamera("good", FakeCapture())
+    unplugged = FailingCamera("unplugged", FakeCapture(unplugged=True))
+    assert unplugged.frame_size == Camera.default_frame_size
+
+    detection = FrameCountingDetection()
+    runner = PipelineRunner(
+        communications=TestNetworkCommunication(),
+        cameras=[good, unplugged],
+        object_detection=detection,
+        stages=["object_detection"],
+        cycle_rate=20,
+    )
+
+    states = collections.defaultdict(list)
+    start = time.time()
+    try:
+        while time.time() - start < 3:
+            runner.run(1)
+            for health in runner.camera_health:
+                states[health.name].append(health.state)
+    finally:
+        for supervisor in runner.camera_supervisors:
+            supervisor.stop()
+
+    assert set(states["Camera good"]) == {"ok"}
+    history = states["Camera unplugged"]
+    assert history[0] == "degraded" and history[-1] == "ok", history
+    assert detection.frames["unplugged"] > 0
+
+
+class HangingDetection(FrameCountingDetection):
+    # Interpreter stand-in whose inference never returns after hang_after calls, until it is reloaded
+    def __init__(self, hang_after: int):
+        super().__init__()
+        self.hang_after = hang_after
+        self.calls = 0
+        self.reloads = 0
+
+    def get_dynamic_objects(self, cam):
+        self.calls += 1
+        if self.calls > self.hang_after:
+            time.sleep(60)
+        return super().get_dynamic_objects(cam)
+
+    def load_interpreter(self):
+        self.reloads += 1
+        self.calls = 0
+
+
+def test_hung_inference_is_abandoned_and_reloaded():
+    camera = FailingCamera("camera", FakeCapture())
+    detection = HangingDetection(hang_after=3)
+    runner = PipelineRunner(
+        communications=TestNetworkCommunication(),
+        cameras=[camera],
+        object_detection=detection,
+        stages=["object_detection"],
+        detector_hang_timeout=0.3,
+    )
+
+    durations = []
+    try:
+        for _ in range(11):
+            start = time.time()
+            runner.run(1)
+            durations.append(time.time() - start)
+    finally:
+        for supervisor in runner.camera_supervisors:
+            supervisor.stop()
+
+    # Every hung call was given up after the timeout, and the detector was reloaded before its next use
+    assert max(durations) < 1, durations
+    assert detection.reloads == 2
+    assert detection.frames["camera"] == 11 - detection.reloads
+    assert runner.object_detection_health.state == "ok"
@@ -1,4 +1,10 @@
 from .utils import *
 from .constants import *
+from .field_grid import *
 from .vision import *
-from .communication import NetworkCommunication
+from .spatial_index import *
+from .world_state import *
+from .supervision import *
+from .pipeline_config import *
+from .profiling import *
+from .communication import NetworkCommunication, LatencyCompensation
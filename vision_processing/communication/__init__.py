@@ -1 +1,2 @@
 from .network_communications import *
+from .latency_compensation import *
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import copy
+import math
+from typing import List
+
+from ..utils import Pose, Translation
+from ..vision.dyanmic_object import DynamicObject
+
+
+class LatencyCompensation:
+    def __init__(
+        self,
+        network_delay: float = 0.01,
+        smoothing: float = 0.5,
+        max_velocity_gap: float = 0.5,
+    ):
+        """
+        Forward-predicts published values from the time their frame was captured to the time they are used,
+        using the measured pipeline latency and the velocity of the robot estimated across cycles.
+        :param network_delay: estimated seconds between publishing and the roboRIO reading the value
+        :type network_delay: float
+        :param smoothing: weight of the newest measurement in the latency and velocity averages (0-1)
+        :type smoothing: float
+        :param max_velocity_gap: seconds between two poses after which the velocity is no longer trusted
+        :type max_velocity_gap: float
+        """
+        self.network_delay = network_delay
+        self.smoothing = smoothing
+        self.max_velocity_gap = max_velocity_gap
+
+        self.latency = 0.0
+        self.velocity = Translation(0, 0)
+        self.angular_velocity = 0.0
+        self._last_pose: Pose | None = None
+        self._last_pose_time: float | None = None
+
+    def record_latency(self, capture_time: float, publish_time: float):
+        """Adds a measurement of the time from capturing a frame to publishing its results"""
+        self.latency += (publish_time - capture_time - self.latency) * self.smoothing
+
+    def target_time(self, capture_time: float) -> float:
+        """The time the values captured at capture_time will be used at on the roboRIO"""
+        return capture_time + self.latency + self.network_delay
+
+    def update_pose(self, pose: Pose, capture_time: float):
+        """Updates the estimated robot velocity with a newly measured pose"""
+        if self._last_pose is not None:
+            time_diff = capture_time - self._last_pose_time
+            if time_diff > self.max_velocity_gap:
+                self.velocity = Translation(0, 0)
+                self.angular_velocity = 0.0
+            elif time_diff > 0:
+                new_velocity = (pose.translation - self._last_pose.translation) / time_diff
+                rotation = math.atan2(
+                    math.sin(pose.rot - self._last_pose.rot), math.cos(pose.rot - self._last_pose.rot)
+                )
+                self.velocity = self.velocity * (1 - self.smoothing) + new_velocity * self.smoothing
+                self.angular_velocity += (rotation / time_diff - self.angular_velocity) * self.smoothing
+
+        self._last_pose = pose
+        self._last_pose_time = capture_time
+
+    def predict_pose(self, pose: Pose, capture_time: float, target_time: float | None = None) -> Pose:
+        """
+        Predicts where the robot will be at target_time, defaulting to when the roboRIO reads the value
+        """
+        if target_time is None:
+            target_time = self.target_time(capture_time)
+        step = target_time - capture_time
+        return Pose(pose.translation + self.velocity * step, pose.rot + self.angular_velocity * step)
+
+    def predict_objects(
+        self,
+        objs: List[DynamicObject],
+        pose: Pose | None,
+        capture_time: float,
+        target_time: float | None = None,
+    ) -> List[DynamicObject]:
+        """
+        Returns copies of the objects, with their absolute coordinates predicted to target_time
+        and their relative coordinates recomputed from the predicted robot pose.
+        Without a pose the objects are returned unchanged, as they cannot be placed on the field.
+        """
+        if pose is None:
+            return objs
+        if target_time is None:
+            target_time = self.target_time(capture_time)
+
+        predicted_pose = self.predict_pose(pose, capture_time, target_time)
+        predicted_objs = []
+        for obj in objs:
+            predicted = copy.copy(obj)
+            if target_time > obj.timestamp:
+                predicted.absolute_coordinates = obj.predict(when=target_time)
+            predicted.relative_coordinates = self.field_to_robot(predicted.absolute_coordinates, predicted_pose)
+            predicted_objs.append(predicted)
+        return predicted_objs
+
+    @staticmethod
+    def field_to_robot(translation: Translation, pose: Pose) -> Translation:
+        """Inverse of Translation.relative_to_pose, converts field coordinates into robot relative coordinates"""
+        difference = translation - pose.translation
+        cos_rot, sin_rot = math.cos(-pose.rot), math.sin(-pose.rot)
+        return Translation(
+            difference.x * cos_rot - difference.y * sin_rot,
+            difference.x * sin_rot + difference.y * cos_rot,
+        )
@@ -1,5 +1,5 @@
 import networktables
-from typing import List
+from typing import List, Optional
 
 from ..utils import Pose, _Counter
 from ..vision.dyanmic_object import DynamicObject
@@ -16,6 +16,9 @@ class NetworkCommunication:
         self.ntinst.startDSClient()
         self.objects_table = self.ntinst.getTable("Objects")
         self.pose_table = self.ntinst.getTable("Pose")
+        self.world_table = self.ntinst.getTable("World")
+        self.health_table = self.ntinst.getTable("Health")
+        self.profiling_table = self.ntinst.getTable("Profiling")
         self._counter = _Counter(0)
 
     def send_objects(self, objs: List[DynamicObject]):
@@ -23,6 +26,44 @@ class NetworkCommunication:
         self.objects_table.putNumberArray("xPos", [obj.relative_coordinates[0] for obj in objs])
         self.objects_table.putNumberArray("yPos", [obj.relative_coordinates[1] for obj in objs])
 
+    def send_world_delta(self, version: int, previous_version: int, added: List[int], updated: List[int],
+                         removed: List[int], objs: List[DynamicObject], snapshot: Optional[List[DynamicObject]] = None):
+        """
+        Publishes only what changed in the world state. objs are the added and updated objects, in field coordinates.
+        NetworkTables only keeps the latest value of an entry, so deltas published between two flushes are lost.
+        A client whose version differs from PreviousVersion missed one, and resynchronizes from the next snapshot:
+        every tracked object, published as of SnapshotVersion.
+        """
+        if snapshot is not None:
+            self.world_table.putNumberArray("SnapshotID", [obj.id for obj in snapshot])
+            self.world_table.putStringArray("SnapshotName", [obj.object_name for obj in snapshot])
+            self.world_table.putNumberArray("SnapshotxPos", [obj.absolute_coordinates[0] for obj in snapshot])
+            self.world_table.putNumberArray("SnapshotyPos", [obj.absolute_coordinates[1] for obj in snapshot])
+            self.world_table.putNumberArray("SnapshotProbability", [obj.probability for obj in snapshot])
+            # Written last, so a changed snapshot version means the arrays above are complete
+            self.world_table.putNumber("SnapshotVersion", version)
+        if not (added or updated or removed):
+            return
+        self.world_table.putNumber("PreviousVersion", previous_version)
+        self.world_table.putNumberArray("AddedID", added)
+        self.world_table.putNumberArray("UpdatedID", updated)
+        self.world_table.putNumberArray("RemovedID", removed)
+        self.world_table.putNumberArray("ID", [obj.id for obj in objs])
+        self.world_table.putStringArray("Name", [obj.object_name for obj in objs])
+        self.world_table.putNumberArray("xPos", [obj.absolute_coordinates[0] for obj in objs])
+        self.world_table.putNumberArray("yPos", [obj.absolute_coordinates[1] for obj in objs])
+        self.world_table.putNumberArray("Probability", [obj.probability for obj in objs])
+        # Written last, so a changed version means the arrays above are complete
+        self.world_table.putNumber("Version", version)
+
+    def send_health(self, names: List[str], states: List[str]):
+        self.health_table.putStringArray("Name", names)
+        self.health_table.putStringArray("State", states)
+
+    def profiling_requested(self) -> bool:
+        """Whether profiling was switched on from the dashboard, through the Profiling/Enabled entry"""
+        return self.profiling_table.getBoolean("Enabled", False)
+
     def send_pose(self, pose: Pose):
         self.pose_table.putNumber("xPos", pose.x)
         self.pose_table.putNumber("yPos", pose.y)
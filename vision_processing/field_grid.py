@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+import numpy as np
+
+from .constants import GameField
+from .utils import Box, Pose, Translation
+
+
+class FieldGrid:
+    """
+    Rasterized occupancy grid of the game field, built once from the GameField boxes.
+    Every cell holds one of the cell values below, so point queries are a single array lookup.
+    """
+
+    FREE = 0
+    SPECIAL = 1
+    DEAD_ZONE = 2
+    OUTSIDE = 3
+
+    def __init__(
+        self,
+        field_boundary: Box,
+        dead_zones: Iterable[Box] = (),
+        special_boundaries: Iterable[Box] = (),
+        resolution: float = 0.05,
+        pose_boundary: Box | None = None,
+    ):
+        """
+        :param field_boundary: box containing the whole field, everything outside is OUTSIDE
+        :type field_boundary: Box
+        :param dead_zones: boxes which no object or robot can be inside of
+        :type dead_zones: Iterable[Box]
+        :param special_boundaries: boxes around special areas of the field
+        :type special_boundaries: Iterable[Box]
+        :param resolution: side length of a cell in meters
+        :type resolution: float
+        :param pose_boundary: box the robot poses measured from AprilTags are checked against, which can be
+            larger than the field objects are limited to, defaults to the field boundary
+        :type pose_boundary: Box | None
+        """
+        self.pose_boundary = pose_boundary or field_boundary
+        self.origin = field_boundary.lower_limit
+        self.resolution = resolution
+        self.width = int(np.ceil((field_boundary.upper_limit.x - self.origin.x) / resolution))
+        self.height = int(np.ceil((field_boundary.upper_limit.y - self.origin.y) / resolution))
+
+        # Indexed as [x, y]
+        self.cells = np.full((self.width, self.height), self.FREE, dtype=np.uint8)
+        for box in special_boundaries:
+            self._fill(box, self.SPECIAL)
+        for box in dead_zones:
+            self._fill(box, self.DEAD_ZONE)
+
+    @classmethod
+    def from_game_field(cls, resolution: float = 0.05) -> "FieldGrid":
+        """
+        Builds the grid from the boxes defined in GameField. Objects are limited to the field boundary,
+        while robot poses may be anywhere around the AprilTag reference points, which span the full field.
+        """
+        xs = [GameField.field_boundary.lower_limit.x, GameField.field_boundary.upper_limit.x]
+        ys = [GameField.field_boundary.lower_limit.y, GameField.field_boundary.upper_limit.y]
+        xs.extend(pose.x for pose in GameField.reference_points.values())
+        ys.extend(pose.y for pose in GameField.reference_points.values())
+        pose_boundary = Box(Translation(min(xs), min(ys)), Translation(max(xs), max(ys)))
+
+        grid = cls(GameField.field_boundary, GameField.dead_zones, GameField.special_boundaries, resolution,
+                   pose_boundary)
+        grid.check_contains(GameField.reference_points.values())
+        return grid
+
+    def check_contains(self, poses: Iterable[Pose]):
+        """Raises a ValueError if any of the poses, e.g. the AprilTag reference points, is outside the pose boundary"""
+        outside = [pose for pose in poses if not self.is_pose_reachable(pose.translation)]
+        if outside:
+            raise ValueError(
+                f"Field grid pose boundary does not contain the reference points at "
+                f"{[(pose.x, pose.y) for pose in outside]}, poses measured from them would be rejected"
+            )
+
+    def _fill(self, box: Box, value: int):
+        """Sets every cell whose center lies inside the box"""
+        x_start, y_start = self._cell_range_start(box.lower_limit)
+        x_end, y_end = self._cell_range_start(box.upper_limit)
+        self.cells[max(x_start, 0):max(x_end, 0), max(y_start, 0):max(y_end, 0)] = value
+
+    def _cell_range_start(self, point: Translation) -> tuple[int, int]:
+        # First cell whose center is at or after the point
+        return (
+            int(np.ceil((point.x - self.origin.x) / self.resolution - 0.5)),
+            int(np.ceil((point.y - self.origin.y) / self.resolution - 0.5)),
+        )
+
+    def query(self, point: Translation) -> int:
+        """Returns the cell value at a field coordinate"""
+        x = int((point.x - self.origin.x) // self.resolution)
+        y = int((point.y - self.origin.y) // self.resolution)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return int(self.cells[x, y])
+        return self.OUTSIDE
+
+    def query_many(self, points: np.ndarray) -> np.ndarray:
+        """
+        Returns the cell values of many field coordinates at once
+        :param points: array of shape (N, 2) holding x and y coordinates
+        :return: array of shape (N,) holding the cell values
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        x = np.floor((points[:, 0] - self.origin.x) / self.resolution).astype(np.intp)
+        y = np.floor((points[:, 1] - self.origin.y) / self.resolution).astype(np.intp)
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+
+        values = np.full(len(points), self.OUTSIDE, dtype=np.uint8)
+        values[inside] = self.cells[x[inside], y[inside]]
+        return values
+
+    def is_reachable(self, point: Translation) -> bool:
+        """Whether something can physically be at the point (inside the field and not in a dead zone)"""
+        return self.query(point) <= self.SPECIAL
+
+    def is_pose_reachable(self, point: Translation) -> bool:
+        """Whether the robot can be at the point (inside the pose boundary and not in a dead zone)"""
+        return self.pose_boundary.is_inside(point) and self.query(point) != self.DEAD_ZONE
+
+    def reachable_mask(self, points: np.ndarray) -> np.ndarray:
+        """Vectorized version of is_reachable, takes an array of shape (N, 2)"""
+        return self.query_many(points) <= self.SPECIAL
+
+    def filter_objects(self, objs: list) -> list:
+        """Removes DynamicObjects whose absolute coordinates cannot be reached"""
+        if not objs:
+            return objs
+        mask = self.reachable_mask([obj.absolute_coordinates for obj in objs])
+        return [obj for obj, reachable in zip(objs, mask) if reachable]
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import copy
+import json
+import re
+from typing import Any, Dict
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from .profiling import PipelineProfiler
+from .vision.camera import CaptureSettings
+
+
+class PipelineConfig:
+    """
+    Declarative definition of the vision pipeline, loaded from a JSON (or, with PyYAML installed, YAML) file.
+    Missing settings take the defaults below, and unknown settings or wrong types are rejected at startup.
+    """
+
+    stages = ("object_detection", "apriltags", "field_filter", "latency_compensation", "world_state")
+
+    defaults: Dict[str, Any] = {
+        "name": "default",
+        "stages": list(stages),
+        "cycle_rate": 0.0,  # maximum cycles per second, 0 for unlimited
+        "supervise_cameras": True,
+        "detection_cache": None,
+        "cameras": [],
+        "object_detection": {
+            "model": "vision_processing/vision/tensorflow_resources/unoptimized.tflite",
+            "edgetpu_model": "vision_processing/vision/tensorflow_resources/model.tflite",
+            "labels": "vision_processing/vision/tensorflow_resources/map.txt",
+            "score_threshold": 0.25,
+            "swap_rb": False,
+            "input_mean": None,  # None with input_std feeds raw pixel values, shifted to int8 for int8 models
+            "input_std": None,
+            "letterbox": False,
+            "tiled": False,
+            "far_field_distance": 3.0,
+            "tile_overlap": 0.2,
+            "nms_iou_threshold": 0.5,
+            "use_opencl": False,
+        },
+        "apriltags": {
+            "family": "tag16h5",
+            "tag_size": 0.1524,
+            "min_decision_margin": 10.0,
+            "threads": 1,
+            "decimate": 2.0,
+        },
+        "field_filter": {
+            "resolution": 0.05,
+        },
+        "latency_compensation": {
+            "network_delay": 0.01,
+            "smoothing": 0.5,
+            "max_velocity_gap": 0.5,
+        },
+        "world_state": {
+            "match_distance": 0.5,
+            "min_probability": 0.1,
+            "publish_tolerance": 0.02,
+            "snapshot_interval": 10,
+        },
+        "profiling": {
+            "enabled": False,  # can also be switched on at runtime through the Profiling/Enabled NetworkTables entry
+            "directory": "profiles",
+            "mode": "sampling",
+            "cycles": 300,
+            "interval": 0.005,
+        },
+    }
+
+    camera_defaults: Dict[str, Any] = {
+        "translational_offset": None,
+        "rotational_offset": None,
+        "focal_length": None,
+        "port": None,
+        "calibration": None,
+        "undistort_frames": False,
+        "capture": {
+            "backend": "any",
+            "width": None,
+            "height": None,
+            "fps": None,
+            "pixel_format": None,
+            "exposure": None,
+            "buffer_size": 1,
+            "luma_only": False,
+        },
+    }
+
+    # Types of the settings which can be None, as a None default does not tell the type.
+    # Camera settings are keyed without their index.
+    optional_types: Dict[str, tuple] = {
+        "detection_cache": (str,),
+        "object_detection.edgetpu_model": (str,),
+        "object_detection.input_mean": (int, float),
+        "object_detection.input_std": (int, float),
+        "cameras.translational_offset": (list,),
+        "cameras.rotational_offset": (list,),
+        "cameras.focal_length": (int, float),
+        "cameras.port": (int, str),
+        "cameras.calibration": (str,),
+        "cameras.capture.width": (int,),
+        "cameras.capture.height": (int,),
+        "cameras.capture.fps": (int, float),
+        "cameras.capture.pixel_format": (str,),
+        "cameras.capture.exposure": (int, float),
+        "cameras.capture.buffer_size": (int,),
+    }
+
+    def __init__(self, settings: Dict[str, Any] | None = None):
+        """
+        :param settings: settings overriding the defaults, with the same layout as the config file
+        :type settings: dict
+        """
+        self.settings = self._merge(self.defaults, settings or {}, "")
+        self.settings["cameras"] = [
+            self._merge(self.camera_defaults, camera, f"cameras[{i}].")
+            for i, camera in enumerate(self.settings["cameras"])
+        ]
+        self.validate()
+
+    @classmethod
+    def load(cls, path: str) -> "PipelineConfig":
+        with open(path, "r") as f:
+            if path.endswith((".yaml", ".yml")):
+                if yaml is None:
+                    raise ImportError("PyYAML is needed to load YAML pipeline configs, use JSON or install pyyaml")
+                return cls(yaml.safe_load(f))
+            return cls(json.load(f))
+
+    def __getitem__(self, key: str) -> Any:
+        return self.settings[key]
+
+    @classmethod
+    def _merge(cls, defaults: Dict[str, Any], overrides: Dict[str, Any], path: str) -> Dict[str, Any]:
+        if not isinstance(overrides, dict):
+            raise ValueError(f"'{path.rstrip('.') or 'config'}' must be a mapping")
+
+        merged = copy.deepcopy(defaults)
+        for key, value in overrides.items():
+            if key not in defaults:
+                raise ValueError(f"Unknown pipeline setting '{path}{key}'")
+
+            default = defaults[key]
+            optional_types = cls.optional_types.get(re.sub(r"\[\d+\]", "", f"{path}{key}"))
+            if isinstance(default, dict):
+                merged[key] = cls._merge(default, value, f"{path}{key}.")
+            elif optional_types is not None:
+                # Booleans are ints to isinstance, but never a valid number setting
+                if value is not None and (isinstance(value, bool) or not isinstance(value, optional_types)):
+                    raise ValueError(
+                        f"Pipeline setting '{path}{key}' must be a "
+                        f"{' or '.join(t.__name__ for t in optional_types)} or null, got {value!r}"
+                    )
+                merged[key] = value
+            elif value is None:
+                raise ValueError(f"Pipeline setting '{path}{key}' cannot be null")
+            elif isinstance(default, bool) != isinstance(value, bool) or (
+                not isinstance(value, type(default)) and not (isinstance(default, float) and isinstance(value, int))
+            ):
+                raise ValueError(
+                    f"Pipeline setting '{path}{key}' must be a {type(default).__name__}, got {value!r}"
+                )
+            else:
+                merged[key] = value
+        return merged
+
+    def validate(self):
+        """Checks the values which can be wrong even with the right type"""
+        unknown_stages = set(self["stages"]) - set(self.stages)
+        if unknown_stages:
+            raise ValueError(f"Unknown pipeline stages {sorted(unknown_stages)}, choose from {list(self.stages)}")
+        if self["cycle_rate"] < 0:
+            raise ValueError("cycle_rate cannot be negative")
+
+        for i, camera in enumerate(self["cameras"]):
+            for key in ("translational_offset", "rotational_offset", "focal_length", "port"):
+                if camera[key] is None:
+                    raise ValueError(f"cameras[{i}].{key} is required")
+            if len(camera["translational_offset"]) != 3 or len(camera["rotational_offset"]) != 2:
+                raise ValueError(f"cameras[{i}] offsets must be (x, y, z) and (pitch, yaw)")
+            offsets = camera["translational_offset"] + camera["rotational_offset"]
+            if any(isinstance(value, bool) or not isinstance(value, (int, float)) for value in offsets):
+                raise ValueError(f"cameras[{i}] offsets must be numbers")
+            try:
+                CaptureSettings(**camera["capture"]).validate()
+            except ValueError as error:
+                raise ValueError(f"cameras[{i}].capture: {error}") from error
+
+        object_detection = self["object_detection"]
+        for key in ("score_threshold", "tile_overlap", "nms_iou_threshold"):
+            if not 0 <= object_detection[key] <= 1:
+                raise ValueError(f"object_detection.{key} must be between 0 and 1")
+        if self["apriltags"]["threads"] < 1:
+            raise ValueError("apriltags.threads must be at least 1")
+        if self["world_state"]["snapshot_interval"] < 1:
+            raise ValueError("world_state.snapshot_interval must be at least 1")
+        if self["field_filter"]["resolution"] <= 0:
+            raise ValueError("field_filter.resolution must be positive")
+
+        profiling = self["profiling"]
+        if profiling["mode"] not in PipelineProfiler.modes:
+            raise ValueError(f"profiling.mode must be one of {list(PipelineProfiler.modes)}")
+        if profiling["cycles"] < 1:
+            raise ValueError("profiling.cycles must be at least 1")
+        if profiling["interval"] <= 0:
+            raise ValueError("profiling.interval must be positive")
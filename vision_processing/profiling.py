@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import collections
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from typing import Any, Dict
+
+
+class PipelineProfiler:
+    SAMPLING = "sampling"
+    CPROFILE = "cprofile"
+    modes = (SAMPLING, CPROFILE)
+
+    def __init__(
+        self,
+        directory: str = "profiles",
+        mode: str = SAMPLING,
+        cycles: int = 300,
+        interval: float = 0.005,
+        top: int = 40,
+    ):
+        """
+        Profiles the pipeline thread in windows of a number of cycles, writing every window to disk,
+        so hot spots which only show up under match load can be looked at after the match.
+        Sampling mode records the pipeline thread's stack every interval seconds from a background thread,
+        which is cheap enough to leave on during a match. Samples are only taken when the pipeline thread releases
+        the GIL, which it does in OpenCV, the interpreter and every few milliseconds of Python.
+        The stacks are written in the collapsed format read by flamegraph.pl and speedscope.
+        cProfile mode traces every call instead, for exact call counts and times at a much higher overhead,
+        and writes a .pstats file.
+        Both modes write a per-function summary (.txt) and the window's tags (.json).
+        :param directory: directory the profiles are written to, created if missing
+        :type directory: str
+        :param mode: "sampling" or "cprofile"
+        :type mode: str
+        :param cycles: number of cycles profiled per window
+        :type cycles: int
+        :param interval: seconds between stack samples in sampling mode
+        :type interval: float
+        :param top: number of functions listed in the summary
+        :type top: int
+        """
+        if mode not in self.modes:
+            raise ValueError(f"Unknown profiling mode '{mode}', choose from {list(self.modes)}")
+        self.directory = directory
+        self.mode = mode
+        self.cycles = cycles
+        self.interval = interval
+        self.top = top
+
+        self.active = False
+        self._first_cycle = 0
+        self._start_time = 0.0
+        self._tags: Dict[str, Any] = {}
+        self._stacks: collections.Counter[str] = collections.Counter()
+        self._profile: cProfile.Profile | None = None
+        self._sampler: threading.Thread | None = None
+        self._stop_sampling = threading.Event()
+
+    def start(self, cycle: int, tags: Dict[str, Any] | None = None):
+        """
+        Starts a window on the calling thread, which has to be the thread running the pipeline
+        :param cycle: number of the first profiled cycle
+        :param tags: description of the pipeline written next to the profile, e.g. its camera configuration
+        """
+        self.active = True
+        self._first_cycle = cycle
+        self._tags = tags or {}
+        self._start_time = time.time()
+        if self.mode == self.CPROFILE:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._stacks = collections.Counter()
+            self._stop_sampling.clear()
+            self._sampler = threading.Thread(
+                target=self._sample, args=(threading.get_ident(),), name="Profiler", daemon=True
+            )
+            self._sampler.start()
+
+    def _sample(self, thread_id: int):
+        while not self._stop_sampling.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                # Collapsed stacks go from the root to the leaf
+                self._stacks[";".join(reversed(stack))] += 1
+
+    def record_cycle(self, cycle: int) -> str | None:
+        """Ends the window once it covered its cycles, returning the path prefix of the written files"""
+        if self.active and cycle - self._first_cycle + 1 >= self.cycles:
+            return self.stop(cycle)
+        return None
+
+    def stop(self, cycle: int) -> str:
+        """
+        Ends the window early, e.g. when the pipeline stops, and writes it to disk
+        :param cycle: number of the last profiled cycle
+        :return: path prefix of the written files
+        """
+        duration = time.time() - self._start_time
+        self.active = False
+        if self.mode == self.CPROFILE:
+            self._profile.disable()
+        else:
+            self._stop_sampling.set()
+            self._sampler.join()
+
+        cycles = max(cycle - self._first_cycle + 1, 0)
+        tags = dict(
+            self._tags,
+            mode=self.mode,
+            first_cycle=self._first_cycle,
+            last_cycle=cycle,
+            cycles=cycles,
+            duration=duration,
+            cycle_time=duration / cycles if cycles else None,
+        )
+
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = os.path.join(
+            self.directory,
+            f"{tags.get('name', 'pipeline')}-{self.mode}-{time.strftime('%Y%m%d-%H%M%S')}"
+            f"-cycles-{self._first_cycle}-{cycle}",
+        )
+        if self.mode == self.CPROFILE:
+            self._profile.dump_stats(prefix + ".pstats")
+            summary = self._cprofile_summary()
+        else:
+            tags["interval"] = self.interval
+            tags["samples"] = sum(self._stacks.values())
+            with open(prefix + ".folded", "w") as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            summary = self._sampling_summary()
+
+        with open(prefix + ".txt", "w") as f:
+            f.write(summary)
+        with open(prefix + ".json", "w") as f:
+            json.dump(tags, f, indent=4, default=repr)
+
+        print(f"Profiled cycles {self._first_cycle}-{cycle}, written to {prefix}.*")
+        return prefix
+
+    def _sampling_summary(self) -> str:
+        self_samples: collections.Counter[str] = collections.Counter()
+        total_samples: collections.Counter[str] = collections.Counter()
+        for stack, count in self._stacks.items():
+            functions = stack.split(";")
+            self_samples[functions[-1]] += count
+            # A recursive function is only counted once per stack
+            for function in set(functions):
+                total_samples[function] += count
+
+        samples = sum(self._stacks.values()) or 1
+        lines = [f"{samples} samples every {self.interval * 1000:g} ms", f"{'self %':>8} {'total %':>8}  function"]
+        for function, count in self_samples.most_common(self.top):
+            lines.append(f"{100 * count / samples:8.2f} {100 * total_samples[function] / samples:8.2f}  {function}")
+        return "\n".join(lines) + "\n"
+
+    def _cprofile_summary(self) -> str:
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats("tottime").print_stats(self.top)
+        return stream.getvalue()
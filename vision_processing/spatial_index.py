@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import heapq
+import math
+from typing import Iterable
+
+import numpy as np
+
+from .constants import GameField
+from .utils import Translation
+from .vision.dyanmic_object import DynamicObject
+
+
+class SpatialIndex:
+    """
+    Uniform grid over the field holding DynamicObjects by their absolute coordinates.
+    Objects are bucketed by cell, so queries only look at the cells around the query point
+    instead of every object on the field.
+    """
+
+    def __init__(self, cell_size: float = 1.0):
+        """
+        :param cell_size: side length of a grid cell in meters
+        :type cell_size: float
+        """
+        self.cell_size = cell_size
+        self._cells: dict[tuple[int, int], set[int]] = {}
+        self._objects: dict[int, DynamicObject] = {}
+        self._object_cells: dict[int, tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def __contains__(self, object_id: int) -> bool:
+        return object_id in self._objects
+
+    def __iter__(self):
+        return iter(self._objects.values())
+
+    def get(self, object_id: int) -> DynamicObject | None:
+        return self._objects.get(object_id)
+
+    def _cell_of(self, point: Translation) -> tuple[int, int]:
+        return int(math.floor(point.x / self.cell_size)), int(math.floor(point.y / self.cell_size))
+
+    def add(self, obj: DynamicObject):
+        """Adds an object, or moves it to its new cell if it is already indexed"""
+        cell = self._cell_of(obj.absolute_coordinates)
+        old_cell = self._object_cells.get(obj.id)
+        if old_cell == cell:
+            self._objects[obj.id] = obj
+            return
+        if old_cell is not None:
+            self._discard_from_cell(obj.id, old_cell)
+
+        self._objects[obj.id] = obj
+        self._object_cells[obj.id] = cell
+        self._cells.setdefault(cell, set()).add(obj.id)
+
+    def update(self, obj: DynamicObject):
+        """Re-buckets an object after its absolute coordinates changed"""
+        self.add(obj)
+
+    def update_all(self):
+        """Re-buckets every indexed object, for use after updating their positions in place"""
+        for obj in list(self._objects.values()):
+            self.add(obj)
+
+    def remove(self, object_id: int) -> DynamicObject | None:
+        """Removes an object from the index and returns it, if it was indexed"""
+        obj = self._objects.pop(object_id, None)
+        cell = self._object_cells.pop(object_id, None)
+        if cell is not None:
+            self._discard_from_cell(object_id, cell)
+        return obj
+
+    def _discard_from_cell(self, object_id: int, cell: tuple[int, int]):
+        members = self._cells[cell]
+        members.discard(object_id)
+        if not members:
+            del self._cells[cell]
+
+    def expire(self, min_probability: float = 0.1) -> list[DynamicObject]:
+        """Removes and returns every object whose probability of existing fell below min_probability"""
+        expired = [obj for obj in self._objects.values() if obj.probability < min_probability]
+        for obj in expired:
+            self.remove(obj.id)
+        return expired
+
+    def _objects_in_cells(self, lower: tuple[int, int], upper: tuple[int, int]) -> Iterable[DynamicObject]:
+        for x in range(lower[0], upper[0] + 1):
+            for y in range(lower[1], upper[1] + 1):
+                for object_id in self._cells.get((x, y), ()):
+                    yield self._objects[object_id]
+
+    def within_radius(self, point: Translation, radius: float) -> list[DynamicObject]:
+        """Returns every object within the radius of the point, closest first"""
+        lower = self._cell_of(Translation(point.x - radius, point.y - radius))
+        upper = self._cell_of(Translation(point.x + radius, point.y + radius))
+
+        found = []
+        for obj in self._objects_in_cells(lower, upper):
+            distance = abs(obj.absolute_coordinates - point)
+            if distance <= radius:
+                found.append((distance, obj.id, obj))
+        found.sort()
+        return [obj for _, _, obj in found]
+
+    def nearest(self, point: Translation, k: int = 1, object_name=None) -> list[DynamicObject]:
+        """
+        Returns the k closest objects to the point, closest first
+        :param point: field coordinates to search around
+        :param k: maximum number of objects to return
+        :param object_name: only consider objects with this name
+        """
+        if not self._cells or k <= 0:
+            return []
+
+        center_x, center_y = self._cell_of(point)
+        # Furthest ring of cells around the point that still holds objects
+        last_ring = max(
+            max(abs(cell_x - center_x), abs(cell_y - center_y)) for cell_x, cell_y in self._cells
+        )
+
+        best: list[tuple[float, int, DynamicObject]] = []  # max-heap on negated distance
+        for ring in range(last_ring + 1):
+            for obj in self._ring_objects(center_x, center_y, ring):
+                if object_name is not None and obj.object_name != object_name:
+                    continue
+                entry = (-abs(obj.absolute_coordinates - point), -obj.id, obj)
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif entry[:2] > best[0][:2]:
+                    heapq.heapreplace(best, entry)
+
+            # Every unvisited cell is at least ring * cell_size away from the point
+            if len(best) == k and -best[0][0] <= ring * self.cell_size:
+                break
+
+        return [obj for _, _, obj in sorted(best, key=lambda entry: entry[:2], reverse=True)]
+
+    def _ring_objects(self, center_x: int, center_y: int, ring: int) -> Iterable[DynamicObject]:
+        if ring == 0:
+            yield from self._objects_in_cells((center_x, center_y), (center_x, center_y))
+            return
+        for x in range(center_x - ring, center_x + ring + 1):
+            for y in (center_y - ring, center_y + ring):
+                for object_id in self._cells.get((x, y), ()):
+                    yield self._objects[object_id]
+        for y in range(center_y - ring + 1, center_y + ring):
+            for x in (center_x - ring, center_x + ring):
+                for object_id in self._cells.get((x, y), ()):
+                    yield self._objects[object_id]
+
+    def nearest_to_special_objects(self) -> dict[str, DynamicObject | None]:
+        """Returns the closest object to each special target in GameField.special_objects, keyed by name"""
+        closest = {}
+        for special_object in GameField.special_objects:
+            found = self.nearest(special_object[4])
+            closest[special_object[2]] = found[0] if found else None
+        return closest
+
+    def push_out(
+        self, points: np.ndarray, distance: float = GameField.robot_radius
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Pushes each point out of every indexed object, so that it is at least
+        the object's radius plus distance away from its center.
+        :param points: array of shape (N, 2) holding x and y coordinates
+        :param distance: clearance to keep, defaults to the robot radius
+        :return: the pushed points, and a boolean mask of which points were moved
+        """
+        points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        changed = np.zeros(len(points), dtype=bool)
+        if not self._objects:
+            return points, changed
+
+        max_radius = max(abs(obj.radius) for obj in self._objects.values())
+        for i, (x, y) in enumerate(points):
+            point = Translation(x, y)
+            for obj in self.within_radius(point, max_radius + distance):
+                point, moved = obj.absolute_coordinates.push_away(point, abs(obj.radius) + distance)
+                changed[i] |= moved
+            points[i] = point
+        return points, changed
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+from .vision.camera import Camera
+
+
+class ComponentHealth:
+    OK = "ok"
+    DEGRADED = "degraded"
+    DEAD = "dead"
+
+    def __init__(self, name: str, timeout: float = 0.5, max_failures: int = 5, retry_interval: float = 1.0):
+        """
+        Tracks the health of a camera or detector from the outcome and duration of each use
+        :param name: name the health is published under
+        :type name: str
+        :param timeout: seconds a use may take before the component counts as degraded
+        :type timeout: float
+        :param max_failures: consecutive failures after which the component counts as dead
+        :type max_failures: int
+        :param retry_interval: seconds between attempts to use a dead component
+        :type retry_interval: float
+        """
+        self.name = name
+        self.timeout = timeout
+        self.max_failures = max_failures
+        self.retry_interval = retry_interval
+
+        self.consecutive_failures = 0
+        self.last_duration = 0.0
+        self.last_error: Exception | None = None
+        self._last_attempt = 0.0
+
+    @property
+    def state(self) -> str:
+        if self.consecutive_failures >= self.max_failures:
+            return self.DEAD
+        if self.consecutive_failures or self.last_duration > self.timeout:
+            return self.DEGRADED
+        return self.OK
+
+    def should_attempt(self) -> bool:
+        """Whether the component should be used this cycle, dead components are only retried every retry_interval"""
+        now = time.time()
+        if self.state == self.DEAD and now - self._last_attempt < self.retry_interval:
+            return False
+        self._last_attempt = now
+        return True
+
+    def record_success(self, duration: float = 0.0):
+        self.consecutive_failures = 0
+        self.last_duration = duration
+        self.last_error = None
+
+    def record_failure(self, error: Exception):
+        if self.consecutive_failures < self.max_failures:
+            print(f"{self.name} failed: {error!r}")
+        self.consecutive_failures += 1
+        self.last_error = error
+
+
+class DetectorHungError(RuntimeError):
+    """Raised when a detector call does not return within its hang timeout"""
+
+
+class DetectorWorker:
+    def __init__(self, name: str, hang_timeout: float = 2.0):
+        """
+        Runs detector calls on a background thread and waits for them up to hang_timeout, so an inference which
+        never returns, e.g. on an Edge TPU which dropped off USB, cannot stall the cycle.
+        A hung call is abandoned together with its thread, and the next call starts a new thread.
+        :param name: name of the worker thread
+        :type name: str
+        :param hang_timeout: seconds a call may block before it is abandoned
+        :type hang_timeout: float
+        """
+        self.name = name
+        self.hang_timeout = hang_timeout
+        self._calls: queue.Queue | None = None
+
+    def run(self, function, *args):
+        """Returns function(*args), raising its exception, or DetectorHungError when it does not return in time"""
+        if self._calls is None:
+            self._calls = queue.Queue()
+            threading.Thread(target=self._work, args=(self._calls,), name=self.name, daemon=True).start()
+
+        done = threading.Event()
+        outcome = {}
+        self._calls.put((function, args, done, outcome))
+        if not done.wait(self.hang_timeout):
+            # The thread stays blocked in the call, so it is left behind with its queue
+            self._calls = None
+            raise DetectorHungError(f"{self.name} did not return within {self.hang_timeout} seconds")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    @staticmethod
+    def _work(calls: queue.Queue):
+        while True:
+            function, args, done, outcome = calls.get()
+            try:
+                outcome["result"] = function(*args)
+            except Exception as error:
+                outcome["error"] = error
+            done.set()
+
+
+class CameraSupervisor:
+    def __init__(
+        self,
+        camera: Camera,
+        name: str | None = None,
+        frame_timeout: float = 0.5,
+        max_failures: int = 5,
+        reconnect_interval: float = 1.0,
+        hang_timeout: float = 2.0,
+    ):
+        """
+        Captures frames from a camera on a background thread, so a slow or hung camera never blocks the cycle.
+        The camera hands out the newest frame through Camera.frame_source, and is reopened in the background
+        once it fails max_failures reads in a row. A watchdog thread reopens the camera on a new capture thread
+        when a read blocks for longer than hang_timeout, abandoning the hung thread.
+        :param camera: camera to supervise
+        :param name: name the camera's health is published under
+        :param frame_timeout: age in seconds after which the newest frame is too old to use
+        :param max_failures: consecutive failed reads before the camera is reopened
+        :param reconnect_interval: seconds to wait between attempts to reopen the camera
+        :param hang_timeout: seconds a single read may block before the camera is reopened
+        """
+        self.camera = camera
+        self.frame_timeout = frame_timeout
+        self.max_failures = max_failures
+        self.reconnect_interval = reconnect_interval
+        self.hang_timeout = hang_timeout
+        self.health = ComponentHealth(name or f"Camera {camera.port_id}", frame_timeout, max_failures)
+
+        self._lock = threading.Lock()
+        # Frames are captured into a pool of three reused buffers: the newest frame, the one handed out
+        # to the cycle, and the one being written, so a frame is never overwritten while it is in use
+        self._buffers: list[np.ndarray | None] = [None, None, None]
+        self._latest: int | None = None
+        self._checked_out: int | None = None
+        self._frame_time = 0.0
+        self._new_frame = threading.Event()
+        self._running = True
+
+        # Capture threads only publish frames while their generation is current, abandoned ones exit
+        self._generation = 0
+        self._reading: int | None = None
+        self._read_started: float | None = None
+
+        camera.frame_source = self
+        self._thread = self._start_capture()
+        self._watchdog = threading.Thread(
+            target=self._watchdog_loop, name=f"{self.health.name} watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    def _start_capture(self) -> threading.Thread:
+        thread = threading.Thread(
+            target=self._capture_loop, args=(self._generation,), name=self.health.name, daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _capture_loop(self, generation: int):
+        failures = 0
+        while self._running:
+            with self._lock:
+                if generation != self._generation:
+                    return
+                index = next(i for i in range(len(self._buffers)) if i not in (self._latest, self._checked_out))
+                self._reading = index
+                self._read_started = time.time()
+
+            capture = self.camera.input_feed
+            try:
+                grabbed, frame = capture.read(image=self._buffers[index])
+            except Exception:
+                grabbed, frame = False, None
+
+            with self._lock:
+                abandoned = generation != self._generation
+                if not abandoned:
+                    self._read_started = None
+                    if grabbed and frame is not None:
+                        self._buffers[index] = frame
+                        self._latest = index
+                        self._frame_time = time.time()
+            if abandoned:
+                # The watchdog already opened a new capture, this one is only released
+                capture.release()
+                return
+
+            if grabbed and frame is not None:
+                failures = 0
+                self._new_frame.set()
+                continue
+
+            failures += 1
+            if failures >= self.max_failures:
+                print(f"{self.health.name} stopped delivering frames, reopening")
+                try:
+                    self.camera.reopen()
+                except Exception as error:
+                    print(f"{self.health.name} could not be reopened: {error!r}")
+                failures = 0
+                time.sleep(self.reconnect_interval)
+
+    def _watchdog_loop(self):
+        # A read which never returns stops the capture thread from counting failures, so it is checked from here
+        while self._running:
+            time.sleep(self.frame_timeout)
+            with self._lock:
+                hung = self._read_started is not None and time.time() - self._read_started > self.hang_timeout
+                if hung:
+                    # The hung read may still write into its buffer, so the pool gets a new one
+                    self._buffers[self._reading] = None
+                    self._read_started = None
+                    self._generation += 1
+            if not hung:
+                continue
+
+            print(f"{self.health.name} hung while reading a frame, reopening")
+            try:
+                self.camera.input_feed = self.camera.capture_settings.open(self.camera.port_id)
+            except Exception as error:
+                print(f"{self.health.name} could not be reopened: {error!r}")
+            self._thread = self._start_capture()
+
+    def latest_frame(self) -> tuple[np.ndarray, float] | None:
+        """
+        Returns the newest frame and the time it was captured, waiting up to frame_timeout for the first one.
+        Returns None if the newest frame is older than frame_timeout.
+        The frame stays untouched until the next call, after which its buffer is reused for capturing.
+        """
+        if self._latest is None:
+            self._new_frame.wait(self.frame_timeout)
+        with self._lock:
+            if self._latest is None or time.time() - self._frame_time > self.frame_timeout:
+                return None
+            self._checked_out = self._latest
+            return self._buffers[self._checked_out], self._frame_time
+
+    def stop(self):
+        """Stops capturing and gives the camera back its direct reads"""
+        self._running = False
+        self._thread.join(self.frame_timeout)
+        self.camera.frame_source = None
@@ -1,7 +1,7 @@
+import itertools
 import math
 import statistics
 from typing import NamedTuple, List
-from scipy import spatial
 
 
 class Pixel(NamedTuple):
@@ -18,13 +18,10 @@ class Translation(NamedTuple):
     y: float
 
     def relative_to_pose(self, pose: "Pose") -> "Translation":
-        polar_coordinates = (
-            spatial.distance.euclidean([0, 0], [self.x, self.y]),
-            math.atan2(self.y, self.x) + pose.rot,
-        )
-
-        x = math.cos(polar_coordinates[1]) * polar_coordinates[0] + pose.x
-        y = math.sin(polar_coordinates[1]) * polar_coordinates[0] + pose.y
+        # Rotate by the pose's cached rotation, then offset by its translation
+        cos_rot, sin_rot = pose.cos_rot, pose.sin_rot
+        x = self.x * cos_rot - self.y * sin_rot + pose.translation.x
+        y = self.x * sin_rot + self.y * cos_rot + pose.translation.y
         return Translation(x, y)
 
     def __neg__(self) -> "Translation":
@@ -82,15 +79,39 @@ class Translation(NamedTuple):
         vector_distance = abs(vector_difference)
         if vector_distance > distance:
             return other_translation, False
+        if vector_distance == 0:
+            # A point on the center has no direction away from it, so it is pushed along x
+            return self + Translation(distance, 0), True
         unit_vector = vector_difference / vector_distance
         final_translation = self + unit_vector * distance
         return final_translation, True
 
 
 class Pose:
+    """A position and rotation on the field. Poses are read-only, so their trig is computed once"""
+
+    __slots__ = ("translation", "rot", "cos_rot", "sin_rot")
+    # Declared for static checkers, which do not see the slots set through object.__setattr__
+    translation: Translation
+    rot: float
+    cos_rot: float
+    sin_rot: float
+
     def __init__(self, translation: Translation, rot: float) -> None:
-        self.translation = translation
-        self.rot = rot
+        # Set around the read-only __setattr__, reads stay plain slot lookups
+        object.__setattr__(self, "translation", translation)
+        object.__setattr__(self, "rot", rot)
+        object.__setattr__(self, "cos_rot", math.cos(rot))
+        object.__setattr__(self, "sin_rot", math.sin(rot))
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError(f"Pose is read-only, create a new Pose instead of setting {name}")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"Pose is read-only, {name} cannot be deleted")
+
+    def __reduce__(self):
+        return Pose, (self.translation, self.rot)
 
     @property
     def x(self) -> float:
@@ -122,13 +143,10 @@ class Pose:
         :returns: The new pose
         :rtype: Pose
         """
-        polar_coordinates = (
-            abs(self.translation),
-            math.atan2(self.y, self.x) + math.pi - self.rot,
-        )
-
-        x = polar_coordinates[0] * math.cos(polar_coordinates[1])
-        y = polar_coordinates[0] * math.sin(polar_coordinates[1])
+        # The negated translation, rotated by -rot
+        cos_rot, sin_rot = self.cos_rot, self.sin_rot
+        x = -(self.x * cos_rot + self.y * sin_rot)
+        y = self.x * sin_rot - self.y * cos_rot
         rot = -self.rot
 
         return Pose(Translation(x, y), rot)
@@ -166,11 +184,28 @@ class Pose:
 
 
 class Box:
+    # Read-only like Pose, as the center and radius are computed from the limits once
+    __slots__ = ("lower_limit", "upper_limit", "center", "radius")
+    lower_limit: Translation
+    upper_limit: Translation
+    center: Translation
+    radius: float
+
     def __init__(self, lower_limit: Translation, upper_limit: Translation):
-        self.lower_limit = lower_limit
-        self.upper_limit = upper_limit
-        self.center = (self.lower_limit + self.upper_limit) / 2
-        self.radius = abs(self.lower_limit - self.center)
+        center = (lower_limit + upper_limit) / 2
+        object.__setattr__(self, "lower_limit", lower_limit)
+        object.__setattr__(self, "upper_limit", upper_limit)
+        object.__setattr__(self, "center", center)
+        object.__setattr__(self, "radius", abs(lower_limit - center))
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError(f"Box is read-only, create a new Box instead of setting {name}")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"Box is read-only, {name} cannot be deleted")
+
+    def __reduce__(self):
+        return Box, (self.lower_limit, self.upper_limit)
 
     def is_inside(self, point: Translation, radius: float = 0) -> bool:
         if (
@@ -209,15 +244,20 @@ class Box:
 
 
 class _Counter:
-    """A class that gives ever-increasing values, starting from any chosen number (defaults to 0)"""
+    """
+    A class that gives ever-increasing values, starting from any chosen number (defaults to 0).
+    Values are drawn from itertools.count, whose next() is atomic, so threads never get the same value.
+    Counters with the same step and different starts give out disjoint ranges, e.g. one per worker process.
+    """
+
+    __slots__ = ("_count",)
 
-    def __init__(self, start=0):
-        self._val = start - 1  # decrease by one to have it start at the right value
+    def __init__(self, start=0, step=1):
+        self._count = itertools.count(start, step)
 
     def next(self):
-        """Increment the counter by one and return the next number"""
-        self._val += 1
-        return self._val
+        """Return the next number"""
+        return next(self._count)
 
 
 dynamic_object_counter = _Counter(start=3)
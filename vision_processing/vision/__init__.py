@@ -1,4 +1,6 @@
+from .calibration import *
 from .camera import *
+from .detection_cache import *
 from .dyanmic_object import *
 from .reference_point import *
 from .tfliteprocessing import *
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import argparse
+import json
+from typing import Sequence
+
+import cv2
+import numpy as np
+
+
+class CameraCalibration:
+    def __init__(self, camera_matrix, dist_coeffs, image_size: tuple[int, int]):
+        """
+        Intrinsics and lens distortion of a camera
+        :param camera_matrix: 3x3 intrinsic matrix [[fx, 0, cx], [0, fy, cy], [0, 0, 1]]
+        :param dist_coeffs: OpenCV distortion coefficients (k1, k2, p1, p2[, k3...])
+        :param image_size: (width, height) the calibration was made at
+        :type image_size: tuple[int, int]
+        """
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64).reshape(3, 3)
+        self.dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64).reshape(-1)
+        self.image_size = (int(image_size[0]), int(image_size[1]))
+        self._undistort_maps: tuple[np.ndarray, np.ndarray] | None = None
+
+    @classmethod
+    def from_pinhole(cls, focal_length: float, image_size: tuple[int, int]) -> "CameraCalibration":
+        """Calibration of an ideal pinhole camera, centered on the image, with no distortion"""
+        width, height = image_size
+        camera_matrix = [
+            [focal_length, 0, width // 2],
+            [0, focal_length, height // 2],
+            [0, 0, 1],
+        ]
+        return cls(camera_matrix, np.zeros(5), image_size)
+
+    @classmethod
+    def from_file(cls, path: str) -> "CameraCalibration":
+        """Loads a calibration saved with `save`"""
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(data["camera_matrix"], data["dist_coeffs"], data["image_size"])
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "camera_matrix": self.camera_matrix.tolist(),
+                    "dist_coeffs": self.dist_coeffs.tolist(),
+                    "image_size": list(self.image_size),
+                },
+                f,
+                indent=4,
+            )
+
+    @classmethod
+    def from_checkerboard(
+        cls,
+        image_paths: Sequence[str],
+        pattern_size: tuple[int, int] = (9, 6),
+        square_size: float = 0.025,
+    ) -> "CameraCalibration":
+        """
+        Solves the intrinsics and distortion from images of a checkerboard, meant to be run offline
+        :param image_paths: paths to images of the checkerboard from different angles
+        :param pattern_size: number of inner corners per (row, column) of the checkerboard
+        :param square_size: side length of a checkerboard square in meters
+        """
+        object_corners = np.zeros((pattern_size[0] * pattern_size[1], 3), np.float32)
+        columns, rows = np.meshgrid(np.arange(pattern_size[0]), np.arange(pattern_size[1]))
+        object_corners[:, :2] = np.stack((columns, rows), axis=-1).reshape(-1, 2) * square_size
+
+        object_points = []
+        image_points = []
+        image_size = None
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+        for path in image_paths:
+            gray = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2GRAY)
+            image_size = gray.shape[::-1]
+            found, corners = cv2.findChessboardCorners(gray, pattern_size, None)
+            if not found:
+                print(f"Checkerboard not found in {path}")
+                continue
+            object_points.append(object_corners)
+            image_points.append(cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria))
+
+        if not image_points:
+            raise ValueError("The checkerboard was not found in any of the images")
+
+        error, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(
+            object_points, image_points, image_size, None, None
+        )
+        print(f"Calibrated from {len(image_points)} images, reprojection error: {error}")
+        return cls(camera_matrix, dist_coeffs, image_size)
+
+    def scaled(self, image_size: tuple[int, int]) -> "CameraCalibration":
+        """
+        Returns the calibration for frames of another resolution covering the same field of view.
+        Raises a ValueError when the aspect ratio differs, as the frames are then cropped differently.
+        """
+        image_size = (int(image_size[0]), int(image_size[1]))
+        if image_size == self.image_size:
+            return self
+        scale_x = image_size[0] / self.image_size[0]
+        scale_y = image_size[1] / self.image_size[1]
+        if abs(scale_x - scale_y) > 0.01 * max(scale_x, scale_y):
+            raise ValueError(
+                f"Calibration made at {self.image_size} cannot be used for {image_size} frames, "
+                f"the aspect ratio differs"
+            )
+
+        camera_matrix = self.camera_matrix.copy()
+        camera_matrix[0] *= scale_x
+        camera_matrix[1] *= scale_y
+        return CameraCalibration(camera_matrix, self.dist_coeffs, image_size)
+
+    @property
+    def fx(self) -> float:
+        return float(self.camera_matrix[0, 0])
+
+    @property
+    def fy(self) -> float:
+        return float(self.camera_matrix[1, 1])
+
+    @property
+    def cx(self) -> float:
+        return float(self.camera_matrix[0, 2])
+
+    @property
+    def cy(self) -> float:
+        return float(self.camera_matrix[1, 2])
+
+    @property
+    def camera_params(self) -> tuple[float, float, float, float]:
+        """(fx, fy, cx, cy), as used by the AprilTag pose estimation"""
+        return self.fx, self.fy, self.cx, self.cy
+
+    @property
+    def has_distortion(self) -> bool:
+        return bool(np.any(self.dist_coeffs))
+
+    def undistort_maps(self) -> tuple[np.ndarray, np.ndarray]:
+        """Remap tables for undistorting whole frames, computed on first use"""
+        if self._undistort_maps is None:
+            self._undistort_maps = cv2.initUndistortRectifyMap(
+                self.camera_matrix, self.dist_coeffs, None, self.camera_matrix, self.image_size, cv2.CV_16SC2
+            )
+        return self._undistort_maps
+
+    def undistort_frame(self, frame: np.ndarray, dst: np.ndarray | None = None) -> np.ndarray:
+        """
+        Undistorts a whole frame with a single remap, keeping the same intrinsics
+        :param dst: buffer of the frame's shape and dtype to write the result into, allocated if None
+        """
+        map_x, map_y = self.undistort_maps()
+        return cv2.remap(frame, map_x, map_y, cv2.INTER_LINEAR, dst=dst)
+
+    def undistort_points(self, points) -> np.ndarray:
+        """
+        Undistorts pixel coordinates without touching the rest of the frame
+        :param points: array of shape (N, 2) of distorted pixel coordinates
+        :return: array of shape (N, 2) of the pixel coordinates an ideal pinhole camera would see
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        if not self.has_distortion:
+            return points.reshape(-1, 2)
+        return cv2.undistortPoints(points, self.camera_matrix, self.dist_coeffs, P=self.camera_matrix).reshape(-1, 2)
+
+    def solve_square_pose(self, corners, size: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Solves the pose of a square marker from its distorted corner pixels, taking the lens distortion into account
+        :param corners: array of shape (4, 2), in the order AprilTag detections give them
+        :param size: side length of the square in meters
+        :return: rotation matrix of shape (3, 3) and translation of shape (3, 1) of the marker in camera coordinates
+        """
+        half = size / 2
+        # Corners in the AprilTag frame (x right, y down), in the order required by SOLVEPNP_IPPE_SQUARE
+        object_points = np.array(
+            [[-half, half, 0], [half, half, 0], [half, -half, 0], [-half, -half, 0]], dtype=np.float64
+        )
+        _, rotation, translation = cv2.solvePnP(
+            object_points,
+            np.asarray(corners, dtype=np.float64).reshape(4, 1, 2),
+            self.camera_matrix,
+            self.dist_coeffs,
+            flags=cv2.SOLVEPNP_IPPE_SQUARE,
+        )
+        return cv2.Rodrigues(rotation)[0], translation.reshape(3, 1)
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Calibrate a camera from checkerboard images")
+    argument_parser.add_argument("output", help="path of the calibration file to write")
+    argument_parser.add_argument("images", nargs="+", help="images of the checkerboard")
+    argument_parser.add_argument("--columns", type=int, default=9, help="inner corners per checkerboard row")
+    argument_parser.add_argument("--rows", type=int, default=6, help="inner corners per checkerboard column")
+    argument_parser.add_argument("--square-size", type=float, default=0.025, help="square side length in meters")
+    arguments = argument_parser.parse_args()
+
+    CameraCalibration.from_checkerboard(
+        arguments.images, (arguments.columns, arguments.rows), arguments.square_size
+    ).save(arguments.output)
@@ -1,19 +1,87 @@
+from __future__ import annotations
+
 import math
 from time import time
 
 import cv2
-from typing import Tuple
+import numpy as np
+from typing import NamedTuple, Tuple
 
 from ..utils import Pixel, Translation
+from .calibration import CameraCalibration
+
+
+class FrameUnavailableError(RuntimeError):
+    """Raised when a camera does not deliver a frame"""
+
+
+class CaptureSettings(NamedTuple):
+    """Settings requested from the capture device when a camera is opened, None leaves the device default"""
+
+    backend: str = "any"  # "any", "v4l2" or "gstreamer" (port_id is then a pipeline string)
+    width: int | None = None
+    height: int | None = None
+    fps: float | None = None
+    pixel_format: str | None = None  # FourCC, e.g. "MJPG" or "YUYV"
+    exposure: float | None = None  # manual exposure, in the units of the driver
+    buffer_size: int | None = 1  # a single buffered frame means every read is the newest frame
+    luma_only: bool = False  # request raw YUYV so the grayscale path can use the Y plane without cvtColor
+
+    backends = {
+        "any": cv2.CAP_ANY,
+        "v4l2": cv2.CAP_V4L2,
+        "gstreamer": cv2.CAP_GSTREAMER,
+    }
+
+    def validate(self):
+        """Raises a ValueError for unknown backends and settings which cannot work together"""
+        if self.backend not in self.backends:
+            raise ValueError(f"Unknown capture backend '{self.backend}', choose from {list(self.backends)}")
+        if self.luma_only and self.pixel_format not in (None, "YUYV"):
+            raise ValueError(f"luma_only needs the YUYV pixel format, got {self.pixel_format}")
+
+    def open(self, port_id) -> cv2.VideoCapture:
+        """Opens the capture device and requests every setting it supports"""
+        self.validate()
+        capture = cv2.VideoCapture(port_id, self.backends[self.backend])
+
+        # The pixel format has to be set before the resolution for V4L2 to negotiate it
+        pixel_format = "YUYV" if self.luma_only else self.pixel_format
+        if pixel_format is not None:
+            capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*pixel_format))
+        if self.width is not None:
+            capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height is not None:
+            capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps is not None:
+            capture.set(cv2.CAP_PROP_FPS, self.fps)
+        if self.buffer_size is not None:
+            capture.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+        if self.exposure is not None:
+            capture.set(cv2.CAP_PROP_AUTO_EXPOSURE, 1)  # manual mode on V4L2
+            capture.set(cv2.CAP_PROP_EXPOSURE, self.exposure)
+        if self.luma_only:
+            # Unconverted frames of any other format (e.g. MJPG bytes) would be read as an image
+            if int(capture.get(cv2.CAP_PROP_FOURCC)) == cv2.VideoWriter_fourcc(*"YUYV"):
+                capture.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+            else:
+                print(f"Camera {port_id} did not accept YUYV, delivering converted frames instead of luma")
+        return capture
 
 
 class Camera:
+    # Assumed for cameras which are unplugged at startup and have no configured or calibrated size
+    default_frame_size = (640, 480)
+
     def __init__(
         self,
         translational_offset: Tuple[float, float, float],
         rotational_offset: Tuple[float, float],
         focal_length: float,
         port_id,
+        calibration: CameraCalibration = None,
+        undistort_frames: bool = False,
+        capture_settings: CaptureSettings = CaptureSettings(),
     ):
         """
         Creates a camera object to be used for various functions
@@ -23,16 +91,48 @@ class Camera:
         :type rotational_offset: tuple[float, float]
         :param port_id: camera id - for testing put the path to a video
         :type port_id: Any
+        :param calibration: intrinsics and distortion of the camera, defaults to a pinhole camera using focal_length
+        :type calibration: CameraCalibration
+        :param undistort_frames: undistort whole frames, otherwise only detected points are undistorted
+        :type undistort_frames: bool
+        :param capture_settings: backend, resolution, fps, pixel format, exposure and buffering of the capture
+        :type capture_settings: CaptureSettings
         """
         self.port_id = port_id
-        self.input_feed: cv2.VideoCapture = cv2.VideoCapture(self.port_id)
+        self.capture_settings: CaptureSettings = capture_settings
+        self.input_feed: cv2.VideoCapture = capture_settings.open(self.port_id)
+        # Set by a CameraSupervisor to hand out frames captured in the background
+        self.frame_source = None
+        self._frame_time = 0.0
         self.translational_offset: Tuple[float, float, float] = translational_offset
         self.rotational_offset: Tuple[float, float] = rotational_offset
-        self.center: Pixel = Pixel(self.get_frame().shape[1] // 2, self.get_frame().shape[0] // 2)
+        try:
+            self.frame_size: Tuple[int, int] = self.get_frame_size()
+        except FrameUnavailableError as error:
+            # An unplugged camera must not stop the pipeline from starting, a CameraSupervisor keeps reopening it
+            self.frame_size = calibration.image_size if calibration is not None else self.default_frame_size
+            print(f"{error}, assuming a frame size of {self.frame_size} until it delivers frames")
+        if calibration is None:
+            calibration = CameraCalibration.from_pinhole(focal_length, self.frame_size)
+        else:
+            # Calibrations made at another resolution are scaled to the negotiated one
+            calibration = calibration.scaled(self.frame_size)
+        self.calibration: CameraCalibration = calibration
+        self.undistort_frames: bool = undistort_frames and calibration.has_distortion
+        self.center: Pixel = Pixel(calibration.cx, calibration.cy)
 
         # If there was a vertical line, extending from the center of the image,
         # allowing us to see shape of the camera capture, this would be its height in pixels.
-        self.center_pixel_height: float = focal_length
+        self.center_pixel_height: float = calibration.fy
+        self.center_pixel_width: float = calibration.fx
+
+        # Frames are read and converted into these buffers, so steady state reads allocate nothing.
+        # OpenCV reallocates a buffer itself when the frame size changes.
+        self._frame_buffer: np.ndarray | None = None
+        self._bgr_buffer: np.ndarray | None = None
+        self._gray_buffer: np.ndarray | None = None
+        self._undistorted_bgr_buffer: np.ndarray | None = None
+        self._undistorted_gray_buffer: np.ndarray | None = None
 
     @classmethod
     def from_list(cls, parameter_list: tuple) -> "Camera":
@@ -42,21 +142,109 @@ class Camera:
             translational_offset: tuple[float, float, float],
             rotational_offset: tuple[float, float],
             focal_length: float,
-            port_id
+            port_id,
+            calibration_path: str (optional)
         ]
         @return: Camera from the list
         """
+        calibration = None
+        if len(parameter_list) > 4 and parameter_list[4] is not None:
+            calibration = CameraCalibration.from_file(parameter_list[4])
+
         return cls(
             parameter_list[0],
             parameter_list[1],
             parameter_list[2],
-            parameter_list[3]
+            parameter_list[3],
+            calibration=calibration
         )
 
-    def get_frame_time(self):
-        return time()
+    def get_frame_size(self) -> Tuple[int, int]:
+        """
+        Returns the (width, height) of the frames, read from the capture properties.
+        A frame is only read if the backend does not report its size.
+        """
+        width = int(self.input_feed.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.input_feed.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if width > 0 and height > 0:
+            return width, height
+        if self.capture_settings.width and self.capture_settings.height:
+            return self.capture_settings.width, self.capture_settings.height
+
+        frame = self.input_feed.read()[1]
+        if frame is None:
+            raise FrameUnavailableError(f"Camera {self.port_id} did not deliver a frame to read its size from")
+        return frame.shape[1], frame.shape[0]
+
+    def reopen(self):
+        """Releases the capture device and opens it again with the same settings"""
+        self.input_feed.release()
+        self.input_feed = self.capture_settings.open(self.port_id)
+
+    def get_frame_time(self) -> float:
+        """Time the last frame read was captured at"""
+        return self._frame_time
+
+    def _read(self) -> np.ndarray:
+        if self.frame_source is not None:
+            latest = self.frame_source.latest_frame()
+            if latest is None:
+                raise FrameUnavailableError(f"Camera {self.port_id} did not deliver a frame")
+            frame, self._frame_time = latest
+            return frame
+
+        frame = self.input_feed.read(image=self._frame_buffer)[1]
+        if frame is None:
+            raise FrameUnavailableError(f"Camera {self.port_id} did not deliver a frame")
+        self._frame_buffer = frame
+        # With a single buffered frame, the frame was captured just before the read returned
+        self._frame_time = time()
+        return frame
+
+    @staticmethod
+    def _is_raw_yuyv(frame: np.ndarray) -> bool:
+        # Unconverted YUYV frames come out as two interleaved channels: Y and alternating U/V
+        return frame.ndim == 3 and frame.shape[2] == 2
+
     def get_frame(self):
-        return self.input_feed.read()[1]
+        """
+        Returns a BGR frame. The frame lives in a buffer reused by the next read,
+        so it has to be copied if it is kept past the current cycle.
+        """
+        frame = self._read()
+        if self._is_raw_yuyv(frame):
+            frame = self._bgr_buffer = cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_YUYV, dst=self._bgr_buffer)
+        elif frame.ndim == 2:
+            frame = self._bgr_buffer = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst=self._bgr_buffer)
+
+        if self.undistort_frames:
+            frame = self._undistorted_bgr_buffer = self.calibration.undistort_frame(
+                frame, dst=self._undistorted_bgr_buffer
+            )
+        return frame
+
+    def get_gray_frame(self):
+        """
+        Returns a grayscale frame, taken straight from the Y plane when the camera delivers one.
+        Like get_frame, the frame is only valid until the next read.
+        """
+        frame = self._read()
+        if self._is_raw_yuyv(frame):
+            frame = self._gray_buffer = cv2.extractChannel(frame, 0, dst=self._gray_buffer)
+        elif frame.ndim == 3:
+            frame = self._gray_buffer = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray_buffer)
+
+        if self.undistort_frames:
+            frame = self._undistorted_gray_buffer = self.calibration.undistort_frame(
+                frame, dst=self._undistorted_gray_buffer
+            )
+        return frame
+
+    def undistort_pixels(self, *pixels: Pixel) -> list[Pixel]:
+        """Undistorts pixel coordinates, unless the whole frame was already undistorted"""
+        if self.undistort_frames or not self.calibration.has_distortion:
+            return list(pixels)
+        return [Pixel(x, y) for x, y in self.calibration.undistort_points(pixels)]
 
     def get_dynamic_object_translation(
         self, bbox_left: Pixel, bbox_right: Pixel
@@ -67,6 +255,7 @@ class Camera:
         :param bbox_right: tuple of length two, bottom right pixel coordinate of bounding box
         :type bbox_right: Pixel
         """
+        bbox_left, bbox_right = self.undistort_pixels(bbox_left, bbox_right)
         left_robot_relative = self.grounded_point_translation(bbox_left)
         right_robot_relative = self.grounded_point_translation(bbox_right)
         perpendicular_connecting_angle = math.pi / 2 + math.atan2(
@@ -90,6 +279,16 @@ class Camera:
 
         return robot_relative_coordinates, radius
 
+    def ground_distance(self, pixel_y: float) -> float:
+        """
+        Forward distance from the camera to the ground seen at a pixel row, along the center column.
+        Rows at or above the horizon never reach the ground, so they are infinitely far.
+        """
+        pitch = math.atan2(-(pixel_y - self.center.y), self.center_pixel_height) + self.rotational_offset[1]
+        if pitch >= 0:
+            return math.inf
+        return self.translational_offset[2] / math.tan(-pitch)
+
     def grounded_point_translation(
         self, pixel_coordinates: Pixel
     ) -> Tuple[float, float]:
@@ -102,7 +301,7 @@ class Camera:
         pixel_x_offset = pixel_coordinates.x - self.center.x
 
         camera_relative_pitch = math.atan2(-pixel_y_offset, self.center_pixel_height)
-        camera_relative_yaw = math.atan2(-pixel_x_offset, self.center_pixel_height)
+        camera_relative_yaw = math.atan2(-pixel_x_offset, self.center_pixel_width)
 
         robot_relative_pitch = camera_relative_pitch + self.rotational_offset[1]
 
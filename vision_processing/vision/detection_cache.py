@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import collections
+import hashlib
+import os
+import tempfile
+from typing import Dict
+
+import numpy as np
+
+
+class DetectionCache:
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Content-addressed, on-disk cache of raw detector outputs, for replaying the same video many times.
+        Entries are keyed by a hash of the frame, the model and the detector configuration,
+        and the least recently used entries are evicted once the cache grows past max_bytes.
+        :param directory: directory the entries are stored in, created if missing
+        :type directory: str
+        :param max_bytes: maximum total size of the entries on disk
+        :type max_bytes: int
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        # Least recently used first, recency is kept on disk through the modification times
+        self._entries: collections.OrderedDict[str, int] = collections.OrderedDict()
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".npz")]
+        for path in sorted(paths, key=os.path.getmtime):
+            self._entries[os.path.basename(path)[:-len(".npz")]] = os.path.getsize(path)
+        self._size = sum(self._entries.values())
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        """Hash of a file's contents, used to key entries by model"""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(frame: np.ndarray, *config) -> str:
+        """Key of a frame processed with the given model hash and detector configuration"""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(repr((frame.shape, frame.dtype.str, config)).encode())
+        digest.update(np.ascontiguousarray(frame).data)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key: str) -> Dict[str, np.ndarray] | None:
+        """Returns the stored outputs, or None on a miss"""
+        if key not in self._entries:
+            self.misses += 1
+            return None
+
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                outputs = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            # Entry was removed or corrupted outside of the cache
+            self._size -= self._entries.pop(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        os.utime(path)
+        self.hits += 1
+        return outputs
+
+    def put(self, key: str, outputs: Dict[str, np.ndarray]):
+        """Stores the outputs, evicting the least recently used entries if the cache is full"""
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(file_descriptor, "wb") as f:
+            np.savez(f, **outputs)
+        # Replacing makes the entry appear complete or not at all
+        os.replace(temporary_path, self._path(key))
+
+        self._size -= self._entries.pop(key, 0)
+        self._entries[key] = os.path.getsize(self._path(key))
+        self._size += self._entries[key]
+
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            evicted, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._path(evicted))
+            except FileNotFoundError:
+                pass
@@ -116,8 +116,10 @@ class DynamicObject:
                 other.timestamp - self.timestamp
             )
 
+            # Blend the prediction with the observed position
+            self.absolute_coordinates = prediction
             self.update_velocity(other.timestamp - self.timestamp, new_velocity)
-            self.update_position(other.timestamp - self.timestamp, prediction)
+            self.update_position(other.timestamp - self.timestamp, other.absolute_coordinates)
 
             self.timestamp = other.timestamp
 
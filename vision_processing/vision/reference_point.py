@@ -1,8 +1,8 @@
 from __future__ import annotations
 
 import math
+from typing import NamedTuple
 
-import cv2
 import numpy
 
 try:
@@ -13,39 +13,79 @@ except ImportError:
 from ..constants import GameField
 from ..utils import Pose, Translation
 from .camera import Camera
+from .detection_cache import DetectionCache
+
+
+class CachedDetection(NamedTuple):
+    """The fields of an apriltags.Detection which are stored in a DetectionCache"""
+
+    tag_id: int
+    hamming: int
+    decision_margin: float
+    center: numpy.ndarray
+    corners: numpy.ndarray
+    pose_R: numpy.ndarray
+    pose_t: numpy.ndarray
 
 
 class ReferencePoint:
     detector = apriltags.Detector(GameField.apriltag_family)
+    detector_config = (GameField.apriltag_family, 1, 2.0)  # (family, threads, decimate) of the detector
+    tag_size = GameField.apriltag_size
+    min_decision_margin = 10
 
-    def __init__(self, pose_to_robot: Pose, pose_to_field: Pose, decision_margin: float):
+    def __init__(self, pose_to_robot: Pose, pose_to_field: Pose, decision_margin: float, timestamp: float = 0.0):
         robot_to_reference = pose_to_robot.reverse()
         robot_to_field = robot_to_reference.relative_to_pose(pose_to_field)
         self.robot_pose = robot_to_field
         self.decision_margin = decision_margin
+        self.timestamp = timestamp  # time the frame the tag was seen in was captured
+
+    @classmethod
+    def configure(
+        cls,
+        family: str = GameField.apriltag_family,
+        tag_size: float = GameField.apriltag_size,
+        min_decision_margin: float = 10,
+        threads: int = 1,
+        decimate: float = 2.0,
+    ):
+        """
+        Replaces the detector and detection settings shared by every camera
+        :param family: AprilTag family to detect
+        :param tag_size: side length of the tags in meters
+        :param min_decision_margin: detections with a lower decision margin are discarded
+        :param threads: number of threads the detector uses
+        :param decimate: factor the image is downsampled by for finding tag outlines
+        """
+        cls.detector = apriltags.Detector(families=family, nthreads=threads, quad_decimate=decimate)
+        cls.detector_config = (family, threads, decimate)
+        cls.tag_size = tag_size
+        cls.min_decision_margin = min_decision_margin
 
     @classmethod
-    def from_apriltags(cls, camera: Camera) -> list["ReferencePoint"]:
+    def from_apriltags(cls, camera: Camera, cache: DetectionCache | None = None) -> list["ReferencePoint"]:
         """
         Create a List of ReferencePoint from an image
+        :param cache: cache of raw detections by frame, for replaying the same video without detecting again
         :rtype ReferencePoint
         """
-        image = cv2.cvtColor(camera.get_frame(), cv2.COLOR_BGR2GRAY)
+        image = camera.get_gray_frame()
+        frame_time = camera.get_frame_time()
         reference_points = []
-
-        # noinspection PyTypeChecker
-        for detection in cls.detector.detect(
-                image,
-                estimate_tag_pose=True,
-                camera_params=(
-                        camera.center_pixel_height,
-                        camera.center_pixel_height,
-                        camera.center.x,
-                        camera.center.y,
-                ),
-                tag_size=GameField.apriltag_size,
-        ):
-            if detection.decision_margin > 10 and (detection.tag_id in GameField.reference_points.keys()):
+        # The detector solves the pose as if the lens had no distortion
+        resolve_pose = camera.calibration.has_distortion and not camera.undistort_frames
+
+        for detection in cls.detect(image, camera.calibration.camera_params, cache):
+            if (
+                    detection.decision_margin > cls.min_decision_margin
+                    and detection.tag_id in GameField.reference_points.keys()
+            ):
+                if resolve_pose:
+                    pose_R, pose_t = camera.calibration.solve_square_pose(detection.corners, cls.tag_size)
+                    detection = CachedDetection(
+                        *(getattr(detection, field) for field in CachedDetection._fields)
+                    )._replace(pose_R=pose_R, pose_t=pose_t)
                 reference_points.append(
                     cls(
                         DetectionPoseInterpretation(
@@ -54,11 +94,39 @@ class ReferencePoint:
                         DetectionPoseInterpretation(
                             camera, detection
                         ).get_pose_relative_to_field(),
-                        detection.decision_margin
+                        detection.decision_margin,
+                        frame_time,
                     )
                 )
         return reference_points
 
+    @classmethod
+    def detect(cls, image: numpy.ndarray, camera_params: tuple, cache: DetectionCache | None = None) -> list:
+        """Detects the AprilTags in a grayscale image, or takes them from the cache if the image was seen before"""
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.key(image, cls.detector_config, cls.tag_size, camera_params)
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return [
+                    CachedDetection(*(stored[field][i] for field in CachedDetection._fields))
+                    for i in range(len(stored["tag_id"]))
+                ]
+
+        # noinspection PyTypeChecker
+        detections = cls.detector.detect(
+            image,
+            estimate_tag_pose=True,
+            camera_params=camera_params,
+            tag_size=cls.tag_size,
+        )
+        if cache_key is not None:
+            cache.put(cache_key, {
+                field: numpy.array([getattr(detection, field) for detection in detections])
+                for field in CachedDetection._fields
+            })
+        return detections
+
 
 class DetectionPoseInterpretation:
     def __init__(self, camera: Camera, detection: apriltags.Detection):
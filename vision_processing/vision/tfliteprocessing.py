@@ -1,8 +1,7 @@
 from __future__ import annotations
 
-import collections
 from time import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, NamedTuple
 
 import cv2
 import numpy as np
@@ -13,6 +12,7 @@ except ImportError:
     import tensorflow.lite as tf
 
 from ..utils import Pixel, Translation
+from .detection_cache import DetectionCache
 from .dyanmic_object import DynamicObject
 
 if TYPE_CHECKING:
@@ -37,32 +37,168 @@ class PBTXTParser:
         return self.file
 
 
-class BBox(collections.namedtuple("BBox", ["xmin", "ymin", "xmax", "ymax"])):
-    """Bounding box.
-    Represents a rectangle which sides are either vertical or horizontal, parallel
-    to the x or y axis.
+class InputMapping(NamedTuple):
     """
+    How a source frame is placed in the model input, and the inverse mapping back to source pixels:
+    source_pixel = normalized_coordinate * scale + offset
+    """
+
+    resized_width: int
+    resized_height: int
+    pad_x: int
+    pad_y: int
+    scale_x: float
+    scale_y: float
+    offset_x: float
+    offset_y: float
+
+    @classmethod
+    def stretched(cls, frame_size: tuple[int, int], input_size: tuple[int, int]) -> "InputMapping":
+        """Mapping for a frame resized to the full input size, ignoring its aspect ratio"""
+        (frame_width, frame_height), (input_width, input_height) = frame_size, input_size
+        return cls(input_width, input_height, 0, 0, frame_width, frame_height, 0, 0)
 
-    xmin: float
-    ymin: float
-    xmax: float
-    ymax: float
-
-    def scale(self, sx, sy):
-        """Returns scaled bounding box."""
-        return BBox(
-            xmin=sx * self.xmin,
-            ymin=sy * self.ymin,
-            xmax=sx * self.xmax,
-            ymax=sy * self.ymax,
+    @classmethod
+    def letterboxed(cls, frame_size: tuple[int, int], input_size: tuple[int, int]) -> "InputMapping":
+        """Mapping for a frame resized with its aspect ratio kept, centered and padded to the input size"""
+        (frame_width, frame_height), (input_width, input_height) = frame_size, input_size
+        ratio = min(input_width / frame_width, input_height / frame_height)
+        resized_width = min(input_width, int(round(frame_width * ratio)))
+        resized_height = min(input_height, int(round(frame_height * ratio)))
+        pad_x = (input_width - resized_width) // 2
+        pad_y = (input_height - resized_height) // 2
+        return cls(
+            resized_width,
+            resized_height,
+            pad_x,
+            pad_y,
+            input_width * frame_width / resized_width,
+            input_height * frame_height / resized_height,
+            -pad_x * frame_width / resized_width,
+            -pad_y * frame_height / resized_height,
         )
 
+    def boxes_to_pixels(self, boxes: np.ndarray, offset: tuple[int, int] = (0, 0)) -> np.ndarray:
+        """
+        Maps an array of normalized model boxes (ymin, xmin, ymax, xmax) to source pixel boxes (xmin, ymin, xmax, ymax)
+        :param offset: (x, y) position of the source frame inside a larger frame, for tiles
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        x = boxes[:, [1, 3]] * self.scale_x + (self.offset_x + offset[0])
+        y = boxes[:, [0, 2]] * self.scale_y + (self.offset_y + offset[1])
+        return np.stack([x[:, 0], y[:, 0], x[:, 1], y[:, 1]], axis=1)
+
+
+def non_max_suppression(
+    boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou_threshold: float = 0.5
+) -> np.ndarray:
+    """
+    Class-aware greedy non-max suppression
+    :param boxes: array of shape (N, 4) of pixel boxes (xmin, ymin, xmax, ymax)
+    :param scores: array of shape (N,)
+    :param classes: array of shape (N,), boxes of different classes never suppress each other
+    :return: indices of the kept boxes, highest score first
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.intp)
+
+    # Offsetting every class into its own region makes boxes of different classes disjoint
+    shifted = boxes + (np.asarray(classes, dtype=np.float64) * (boxes.max() - boxes.min() + 1))[:, None]
+    areas = (shifted[:, 2] - shifted[:, 0]) * (shifted[:, 3] - shifted[:, 1])
+    order = np.argsort(-np.asarray(scores), kind="stable")
+
+    keep = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.minimum(shifted[best, 2], shifted[rest, 2]) - np.maximum(shifted[best, 0], shifted[rest, 0])
+        height = np.minimum(shifted[best, 3], shifted[rest, 3]) - np.maximum(shifted[best, 1], shifted[rest, 1])
+        intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+        iou = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.intp)
+
 
 class DynamicObjectProcessing:
-    def __init__(self):
+    # Output order of the TFLite_Detection_PostProcess op, keyed by tensor name suffix
+    detection_output_suffixes = {"": "boxes", ":1": "classes", ":2": "scores", ":3": "count"}
+    # Fallback output order used by models exported without the post-process op names
+    default_output_order = {"boxes": 1, "classes": 3, "scores": 0, "count": 2}
+
+    def __init__(
+        self,
+        model_path: str = "vision_processing/vision/tensorflow_resources/unoptimized.tflite",
+        edgetpu_model_path: str | None = "vision_processing/vision/tensorflow_resources/model.tflite",
+        labels_path: str = "vision_processing/vision/tensorflow_resources/map.txt",
+        score_threshold: float = 0.25,
+        swap_rb: bool = False,
+        input_mean: float | None = None,
+        input_std: float | None = None,
+        letterbox: bool = False,
+        cache: DetectionCache | None = None,
+        tiled: bool = False,
+        far_field_distance: float = 3.0,
+        tile_overlap: float = 0.2,
+        nms_iou_threshold: float = 0.5,
+        use_opencl: bool = False,
+    ):
+        """
+        Runs a TFLite SSD detection model over camera frames.
+        Preprocessing is derived from the interpreter's input details, so uint8, int8 and float models
+        can be swapped in without changing the pipeline.
+        :param model_path: model run on the CPU
+        :param edgetpu_model_path: model compiled for the Coral Edge TPU, tried first when given
+        :param labels_path: file with one label per line, indexed by class id
+        :param score_threshold: detections with a lower score are discarded
+        :param swap_rb: convert the BGR frames from OpenCV to RGB before inference
+        :param input_mean: mean subtracted from each pixel value before scaling (real value space),
+            None together with input_std feeds the raw pixel values, which is what the shipped models are given.
+            int8 models are given the raw pixel values shifted by -128, float models need both to be set
+        :param input_std: standard deviation each pixel value is divided by (real value space)
+        :param letterbox: keep the frame's aspect ratio and pad it, instead of stretching it to the input size
+        :param cache: cache of raw model outputs by frame, for replaying the same video without inference
+        :param tiled: also run the model on full resolution tiles of the far field, to detect distant game pieces
+        :param far_field_distance: ground distance in meters beyond which the image counts as far field
+        :param tile_overlap: fraction of a tile shared with its neighbours, so objects on a seam are seen whole
+        :param nms_iou_threshold: overlap above which duplicate detections from the full frame and tiles are merged
+        :param use_opencl: resize and convert through OpenCV's transparent API (UMat), which runs on the GPU
+            through OpenCL when available and falls back to the CPU otherwise
+        """
+        self.cpu_model_path = model_path
+        self.edgetpu_model_path = edgetpu_model_path
+        self.score_threshold = score_threshold
+        self.swap_rb = swap_rb
+        self.input_mean = input_mean
+        self.input_std = input_std
+        self.letterbox = letterbox
+        self.cache = cache
+        # OpenCL only pays off with a device to run on, without one UMat just adds copies
+        self.use_opencl = use_opencl and cv2.ocl.haveOpenCL()
+        if self.use_opencl:
+            cv2.ocl.setUseOpenCL(True)
+        # Resized and color converted images by resized (width, height), reused as outputs every frame
+        self._preprocess_buffers: dict[tuple[int, int], list[np.ndarray | None]] = {}
+        self.load_interpreter()
+
+        self.tiled = tiled
+        self.far_field_distance = far_field_distance
+        self.tile_overlap = tile_overlap
+        self.nms_iou_threshold = nms_iou_threshold
+        self._far_field_tiles: dict["Camera", list[tuple[int, int, int]]] = {}
+
+        print("Getting labels")
+        parser = PBTXTParser(labels_path)
+        parser.parse()
+        self.labels = parser.get_labels()
+        self.frames = 0
+
+    def load_interpreter(self):
+        """Creates the interpreter, on the Coral Edge TPU if one is available. Also used to recover a failed one."""
         print("Initializing TFLite runtime interpreter")
         try:
-            model_path = "vision_processing/vision/tensorflow_resources/model.tflite"
+            if self.edgetpu_model_path is None:
+                raise ValueError("No Edge TPU model given")
+            model_path = self.edgetpu_model_path
             self.interpreter = tf.Interpreter(
                 model_path,
                 experimental_delegates=[
@@ -72,16 +208,17 @@ class DynamicObjectProcessing:
             self.hardware_type = "Coral Edge TPU"
         except:
             print("Failed to create Interpreter with Coral, switching to unoptimized")
-            model_path = "vision_processing/vision/tensorflow_resources/unoptimized.tflite"
+            model_path = self.cpu_model_path
             self.interpreter = tf.Interpreter(model_path)
             self.hardware_type = "Unoptimized"
 
         self.interpreter.allocate_tensors()
-        print("Getting labels")
-        parser = PBTXTParser("vision_processing/vision/tensorflow_resources/map.txt")
-        parser.parse()
-        self.labels = parser.get_labels()
-        self.frames = 0
+        self.model_path = model_path
+        self.model_hash = DetectionCache.hash_file(model_path) if self.cache is not None else None
+        self._input_mappings: dict[tuple[int, int], InputMapping] = {}
+        self._buffer_mapping: InputMapping | None = None
+        self._configure_input()
+        self._configure_output()
 
     def get_dynamic_objects(self, cam: "Camera") -> list[DynamicObject]:
         start = time()
@@ -89,85 +226,249 @@ class DynamicObjectProcessing:
         frame_cv2 = cam.get_frame()
         frame_time = cam.get_frame_time()
 
+        boxes, class_ids, scores = self.pixel_detections(frame_cv2)
+        if self.tiled:
+            boxes, class_ids, scores = self.add_far_field_detections(cam, frame_cv2, boxes, class_ids, scores)
+
+        dynamic_objects = []
+        for box, class_id in zip(boxes, class_ids):
+            xmin, ymin, xmax, ymax = (int(value) for value in box)
+            relative_coordinates, radius = cam.get_dynamic_object_translation(
+                Pixel(xmin, ymax), Pixel(xmax, ymax)
+            )
+            dynamic_objects.append(
+                DynamicObject(
+                    Translation(*relative_coordinates),
+                    radius,
+                    self.labels[class_id],
+                    frame_time,
+                )
+            )
+
+        if self.frames % 100 == 0:
+            print("Completed", self.frames, "frames. FPS:", (1 / (time() - start)))
+        self.frames += 1
+        return dynamic_objects
+
+    def detect(self, frame: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, InputMapping]:
+        """Runs the model over a frame, or takes its outputs from the cache if the frame was seen before"""
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(
+                frame, self.model_hash, self.swap_rb, self.input_mean, self.input_std, self.letterbox
+            )
+            outputs = self.cache.get(cache_key)
+            if outputs is not None:
+                h, w, _ = frame.shape
+                return outputs["boxes"], outputs["classes"], outputs["scores"], self.input_mapping((w, h))
+
         # input
-        scale = self.set_input(frame_cv2)
+        mapping = self.set_input(frame)
 
         # run inference
         self.interpreter.invoke()
 
-        dynamic_objects = []
         # output
-        boxes, class_ids, scores, x_scale, y_scale = self.get_output(scale)
-        for i in range(len(boxes)):
-            if scores[i] > 0.25:
+        boxes, classes, scores, mapping = self.get_output(mapping)
+        if cache_key is not None:
+            self.cache.put(cache_key, {"boxes": boxes, "classes": classes, "scores": scores})
+        return boxes, classes, scores, mapping
 
-                class_id = class_ids[i]
-                if np.isnan(class_id):
-                    continue
+    def pixel_detections(
+        self, frame: np.ndarray, offset: tuple[int, int] = (0, 0)
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the confident detections in a frame as pixel boxes (xmin, ymin, xmax, ymax), class ids and scores
+        :param offset: (x, y) position of the frame inside the camera frame, for tiles
+        """
+        boxes, classes, scores, mapping = self.detect(frame)
+        keep = (scores > self.score_threshold) & ~np.isnan(classes)
+        keep[keep] &= (classes[keep] >= 0) & (classes[keep] < len(self.labels))
+        return mapping.boxes_to_pixels(boxes[keep], offset), classes[keep].astype(int), scores[keep]
 
-                class_id = int(class_id)
-                if class_id not in range(len(self.labels)):
-                    continue
+    def far_field_tiles(self, cam: "Camera") -> list[tuple[int, int, int]]:
+        """
+        Returns square tiles (x, y, size) at the camera's full resolution covering the far field band,
+        the rows between the horizon and where the ground is far_field_distance away. Computed once per camera.
+        """
+        if cam in self._far_field_tiles:
+            return self._far_field_tiles[cam]
 
-                ymin, xmin, ymax, xmax = boxes[i]
-                bbox = BBox(xmin=xmin, ymin=ymin, xmax=xmax, ymax=ymax).scale(
-                    x_scale, y_scale
-                )
-                ymin = int(bbox.ymin)
-                xmin = int(bbox.xmin)
-                ymax = int(bbox.ymax)
-                xmax = int(bbox.xmax)
-                relative_coordinates, radius = cam.get_dynamic_object_translation(
-                    Pixel(xmin, ymax), Pixel(xmax, ymax)
-                )
-                dynamic_objects.append(
-                    DynamicObject(
-                        Translation(*relative_coordinates),
-                        radius,
-                        self.labels[class_id],
-                        frame_time,
-                    )
-                )
+        width, height = cam.frame_size
+        far_rows = [y for y in range(height) if cam.ground_distance(y + 0.5) > self.far_field_distance]
 
-        if self.frames % 100 == 0:
-            print("Completed", self.frames, "frames. FPS:", (1 / (time() - start)))
-        self.frames += 1
-        return dynamic_objects
+        tiles = []
+        if far_rows:
+            size = min(max(self.input_size()), width, height)
+            stride = max(1, int(size * (1 - self.tile_overlap)))
+            # Objects stand on the far field boundary, so the tile reaches slightly below it
+            bottom = min(height, max(far_rows) + 1 + int(size * self.tile_overlap))
+            top = max(0, bottom - size)
+            columns = list(range(0, width - size, stride)) + [width - size]
+            tiles = [(x, top, size) for x in columns]
+
+        self._far_field_tiles[cam] = tiles
+        return tiles
+
+    def add_far_field_detections(
+        self, cam: "Camera", frame: np.ndarray, boxes: np.ndarray, classes: np.ndarray, scores: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Adds the detections from the far field tiles, and merges duplicates with non-max suppression"""
+        all_boxes, all_classes, all_scores = [boxes], [classes], [scores]
+        for x, y, size in self.far_field_tiles(cam):
+            tile_boxes, tile_classes, tile_scores = self.pixel_detections(frame[y:y + size, x:x + size], (x, y))
+            all_boxes.append(tile_boxes)
+            all_classes.append(tile_classes)
+            all_scores.append(tile_scores)
+
+        boxes, classes, scores = np.concatenate(all_boxes), np.concatenate(all_classes), np.concatenate(all_scores)
+        keep = non_max_suppression(boxes, scores, classes, self.nms_iou_threshold)
+        return boxes[keep], classes[keep], scores[keep]
 
     def input_size(self) -> tuple[int, int]:
         """Returns input image size as (width, height) tuple."""
-        _, height, width, _ = self.interpreter.get_input_details()[0]["shape"]
-        return width, height
+        return self.input_width, self.input_height
 
-    def set_input(self, frame: np.ndarray) -> tuple[float, float]:
-        """Copies a resized and properly zero-padded image to the input tensor.
+    def _configure_input(self):
+        """
+        Reads the input tensor details and compiles the preprocessing into a single lookup table,
+        mapping every possible uint8 pixel value directly to the model's input dtype.
+        """
+        details = self.interpreter.get_input_details()[0]
+        _, height, width, _ = details["shape"]
+        self.input_width, self.input_height = int(width), int(height)
+        self.input_index = details["index"]
+        self.input_dtype = np.dtype(details["dtype"])
+
+        scale, zero_point = details.get("quantization", (0.0, 0))
+        pixels = np.arange(256, dtype=np.float64)
+        if self.input_mean is None or self.input_std is None:
+            if self.input_dtype == np.uint8:
+                lut = pixels
+            elif self.input_dtype == np.int8:
+                # An int8 model quantized from a uint8 one has its zero point shifted by -128,
+                # so shifting the raw pixels keeps the real values the uint8 model was given
+                lut = pixels - 128
+            else:
+                raise ValueError(
+                    f"{self.model_path} takes {self.input_dtype} input, which raw pixel values can't be fed to, "
+                    "set input_mean and input_std to the normalization the model was trained with"
+                )
+        elif self.input_dtype == np.float32:
+            lut = (pixels - self.input_mean) / self.input_std
+        elif scale:
+            # Quantize the normalized value: q = real / scale + zero_point
+            lut = (pixels - self.input_mean) / (self.input_std * scale) + zero_point
+        else:
+            lut = pixels
+
+        if np.issubdtype(self.input_dtype, np.integer):
+            info = np.iinfo(self.input_dtype)
+            lut = np.clip(np.round(lut), info.min, info.max)
+        self._input_lut = lut.astype(self.input_dtype)
+        # uint8 models whose quantization cancels out the normalization need no conversion at all
+        self._identity_lut = self.input_dtype == np.uint8 and np.array_equal(self._input_lut, np.arange(256))
+
+        self._input_buffer = np.empty((1, self.input_height, self.input_width, 3), dtype=self.input_dtype)
+
+    def _configure_output(self):
+        """
+        Maps the detection outputs (boxes, classes, scores, count) to their tensor indices by name,
+        and stores the quantization parameters needed to dequantize them.
+        """
+        details = self.interpreter.get_output_details()
+        self.output_indices = {}
+        for detail in details:
+            name = detail.get("name", "")
+            if "TFLite_Detection_PostProcess" not in name:
+                continue
+            suffix = name[name.index("TFLite_Detection_PostProcess") + len("TFLite_Detection_PostProcess"):]
+            if suffix in self.detection_output_suffixes:
+                self.output_indices[self.detection_output_suffixes[suffix]] = detail["index"]
+
+        if len(self.output_indices) != len(self.detection_output_suffixes):
+            self.output_indices = {
+                output: details[position]["index"] for output, position in self.default_output_order.items()
+            }
+
+        self._output_quantization = {
+            detail["index"]: detail.get("quantization", (0.0, 0)) for detail in details
+        }
+
+    def input_mapping(self, frame_size: tuple[int, int]) -> InputMapping:
+        """Returns the input mapping for a (width, height) frame size, computed once per resolution."""
+        mapping = self._input_mappings.get(frame_size)
+        if mapping is None:
+            if self.letterbox:
+                mapping = InputMapping.letterboxed(frame_size, self.input_size())
+            else:
+                mapping = InputMapping.stretched(frame_size, self.input_size())
+            self._input_mappings[frame_size] = mapping
+        return mapping
+
+    def set_input(self, frame: np.ndarray) -> InputMapping:
+        """Copies a resized, channel-ordered and normalized image to the input tensor.
         Args:
           frame: image
         Returns:
-          Actual resize ratio, which should be passed to `get_output` function.
+          Mapping from the model input back to the frame, which should be passed to `get_output` function.
         """
-        width, height = self.input_size()
         h, w, _ = frame.shape
-        new_img = np.reshape(cv2.resize(frame, (320, 320)), (1, 320, 320, 3))
-        self.interpreter.set_tensor(self.interpreter.get_input_details()[0]['index'], np.copy(new_img))
-        return width / w, height / h
+        mapping = self.input_mapping((w, h))
+        if mapping != self._buffer_mapping:
+            # Padding only has to be written when the layout changes, the image area is overwritten every frame
+            self._input_buffer.fill(self._input_lut[0])
+            self._buffer_mapping = mapping
+
+        resized = self._preprocess(frame, (mapping.resized_width, mapping.resized_height))
+        target = self._input_buffer[
+            0,
+            mapping.pad_y:mapping.pad_y + mapping.resized_height,
+            mapping.pad_x:mapping.pad_x + mapping.resized_width,
+        ]
+        if self._identity_lut:
+            target[...] = resized
+        else:
+            # Writes straight into the input buffer, np.take would convert the indices to intp every frame
+            cv2.LUT(resized, self._input_lut, dst=target)
+        self.interpreter.set_tensor(self.input_index, self._input_buffer)
+        return mapping
+
+    def _preprocess(self, frame: np.ndarray, size: tuple[int, int]) -> np.ndarray:
+        """
+        Resizes the frame and converts it to the model's channel order.
+        On the CPU path the results are written into buffers kept per size, so steady state frames allocate nothing;
+        the returned image is only valid until the next frame of the same size.
+        """
+        if self.use_opencl:
+            resized = cv2.resize(cv2.UMat(frame), size)
+            if self.swap_rb:
+                resized = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+            return resized.get()
+
+        buffers = self._preprocess_buffers.setdefault(size, [None, None])
+        buffers[0] = cv2.resize(frame, size, dst=buffers[0])
+        if not self.swap_rb:
+            return buffers[0]
+        buffers[1] = cv2.cvtColor(buffers[0], cv2.COLOR_BGR2RGB, dst=buffers[1])
+        return buffers[1]
 
-    def output_tensor(self, i):
-        """Returns output tensor view."""
-        tensor = self.interpreter.tensor(self.interpreter.get_output_details()[i]['index'])()
-        return np.squeeze(tensor)
+    def output_tensor(self, name: str) -> np.ndarray:
+        """Returns the named output tensor, dequantized if the model's outputs are quantized."""
+        index = self.output_indices[name]
+        tensor = np.squeeze(self.interpreter.tensor(index)())
+        scale, zero_point = self._output_quantization[index]
+        if scale:
+            return (tensor.astype(np.float32) - zero_point) * scale
+        return tensor
 
     def get_output(
-        self, scale: tuple[float, float]
-    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, float, float]:
+        self, mapping: InputMapping
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, InputMapping]:
 
         # Get all outputs from the model
-        boxes = self.output_tensor(1)
-        classes = self.output_tensor(3)
-        scores = self.output_tensor(0)
-        count = int(self.output_tensor(2))
-
-        width, height = self.input_size()
-        image_scale_x, image_scale_y = scale
-        x_scale, y_scale = width / image_scale_x, height / image_scale_y
-        return boxes, classes, scores, x_scale, y_scale
+        boxes = self.output_tensor("boxes")
+        classes = self.output_tensor("classes")
+        scores = self.output_tensor("scores")
+        count = int(self.output_tensor("count"))
+        return boxes, classes, scores, mapping
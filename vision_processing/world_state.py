@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+from typing import Dict, List, NamedTuple, Optional
+
+from .constants import GameField
+from .spatial_index import SpatialIndex
+from .utils import Pose, Translation
+from .vision.dyanmic_object import DynamicObject
+
+
+class WorldDelta(NamedTuple):
+    """The changes to the world state since the last published version"""
+
+    version: int
+    previous_version: int  # version the changes apply on top of, a client at another version has missed a delta
+    added: List[int]
+    updated: List[int]
+    removed: List[int]
+    objects: Dict[int, DynamicObject]  # the added and updated objects, by id
+    snapshot: Optional[Dict[int, DynamicObject]]  # every tracked object by id, included every snapshot_interval calls
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+
+class WorldState:
+    def __init__(
+        self,
+        match_distance: float = 0.5,
+        min_probability: float = 0.1,
+        publish_tolerance: float = 0.02,
+        snapshot_interval: int = 10,
+    ):
+        """
+        Persistent model of the field: the robot pose, the tracked objects and the special targets.
+        Observations are merged into it every cycle, and only the changes are handed out for publishing.
+        :param match_distance: furthest distance in meters a detection can be from a tracked object to update it
+        :type match_distance: float
+        :param min_probability: tracked objects are removed once their probability falls below this
+        :type min_probability: float
+        :param publish_tolerance: distance in meters an object has to move before it is published again
+        :type publish_tolerance: float
+        :param snapshot_interval: number of deltas between full snapshots, which let a client that missed
+            a delta (e.g. several deltas published between two NetworkTables flushes) resynchronize
+        :type snapshot_interval: int
+        """
+        self.match_distance = match_distance
+        self.min_probability = min_probability
+        self.publish_tolerance = publish_tolerance
+        self.snapshot_interval = snapshot_interval
+
+        self.robot_pose = Pose(Translation(0, 0), 0)
+        self.pose_time = 0.0
+        self.has_pose = False
+        self.version = 0
+        self._deltas = 0
+        self.objects = SpatialIndex()
+
+        # Kept out of the index, so nearest object searches never return a target itself
+        self.special_targets = {}
+        for special_object in GameField.special_objects:
+            target = DynamicObject.from_list(special_object)
+            self.special_targets[target.id] = target
+
+        self._published: Dict[int, Translation] = {}
+        self._added: set[int] = set(self.special_targets)
+        self._removed: set[int] = set()
+
+    def update_pose(self, pose: Pose, timestamp: float = 0.0):
+        """
+        :param pose: measured robot pose
+        :param timestamp: time the frame the pose was measured from was captured
+        """
+        self.robot_pose = pose
+        self.pose_time = timestamp
+        self.has_pose = True
+
+    def merge(self, observations: List[DynamicObject], timestamp: float):
+        """
+        Merges a cycle's detections into the tracked objects. Detections are matched to the closest tracked
+        object with the same name, unmatched detections start being tracked, and tracked objects which
+        were not seen decay and eventually expire.
+        :param observations: detections with absolute coordinates
+        :param timestamp: time the detections were captured
+        """
+        matched = set()
+        for observation in observations:
+            tracked = self._match(observation, matched)
+            if tracked is None:
+                self.objects.add(observation)
+                self._added.add(observation.id)
+                matched.add(observation.id)
+                continue
+
+            if observation.timestamp > tracked.timestamp:
+                tracked.update(observation)
+            else:
+                tracked.absolute_coordinates = observation.absolute_coordinates
+                tracked.probability = 1
+            tracked.relative_coordinates = observation.relative_coordinates
+            self.objects.update(tracked)
+            matched.add(tracked.id)
+
+        for tracked in list(self.objects):
+            if tracked.id not in matched and timestamp > tracked.timestamp:
+                tracked.update(timestamp=timestamp)
+                self.objects.update(tracked)
+
+        for expired in self.objects.expire(self.min_probability):
+            if expired.id in self._added:
+                self._added.discard(expired.id)
+            else:
+                self._removed.add(expired.id)
+
+    def _match(self, observation: DynamicObject, matched: set[int]) -> DynamicObject | None:
+        candidates = self.objects.within_radius(observation.absolute_coordinates, self.match_distance)
+        for candidate in candidates:
+            if candidate.id not in matched and candidate.object_name == observation.object_name:
+                return candidate
+        return None
+
+    def get(self, object_id: int) -> DynamicObject | None:
+        """Returns a tracked object or special target by id"""
+        obj = self.objects.get(object_id)
+        return obj if obj is not None else self.special_targets.get(object_id)
+
+    def delta(self) -> WorldDelta:
+        """
+        Returns the changes since the last call and marks them as published.
+        The version only increases when something changed. The first delta and every snapshot_interval-th
+        one after it also hold a snapshot of the whole world, tagged with the same version.
+        """
+        updated = []
+        for object_id, position in self._published.items():
+            obj = self.get(object_id)
+            if obj is not None and abs(obj.absolute_coordinates - position) > self.publish_tolerance:
+                updated.append(object_id)
+
+        added = sorted(self._added)
+        removed = sorted(self._removed)
+        changed = added + updated
+        snapshot = None
+        if self._deltas % self.snapshot_interval == 0:
+            snapshot = dict(self.special_targets)
+            snapshot.update((obj.id, obj) for obj in self.objects)
+        self._deltas += 1
+        delta = WorldDelta(
+            self.version + 1 if (added or updated or removed) else self.version,
+            self.version,
+            added,
+            updated,
+            removed,
+            {object_id: self.get(object_id) for object_id in changed},
+            snapshot,
+        )
+
+        self.version = delta.version
+        for object_id in changed:
+            self._published[object_id] = self.get(object_id).absolute_coordinates
+        for object_id in removed:
+            self._published.pop(object_id, None)
+        self._added.clear()
+        self._removed.clear()
+        return delta